@@ -0,0 +1,72 @@
+"""
+Compare raw data join times on an unindexed database against one set up by `prepare_database`.
+
+python -m benchmark.bench_database --n-homes 200
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmark.synthetic import write_synthetic_database
+from lib.common.database import close_connections, get_connection
+from lib.common.tables import prepare_database
+from lib.data.features import iter_raw_data_by_home, read_raw_data
+from lib.data.split import add_train_valid_test_split_table
+
+
+def _best_time(func, repeats: int) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _drop_indexes(database_location: str) -> None:
+    conn = get_connection(database_location)
+    for (index_name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='index'").fetchall():
+        conn.execute(f"DROP INDEX {index_name}")
+    conn.commit()
+    close_connections(database_location)
+
+
+def _time_joins(database_location: str, repeats: int) -> dict[str, float]:
+    return {
+        "read_raw_data": _best_time(lambda: read_raw_data(database_location, train=True), repeats),
+        "iter_raw_data_by_home": _best_time(
+            lambda: sum(len(home) for home in iter_raw_data_by_home(database_location, train=True)), repeats
+        ),
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print a table of results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-homes", type=int, default=200)
+    parser.add_argument("--n-days", type=int, default=7)
+    parser.add_argument("--triggers-per-day", type=int, default=300)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database_location = os.path.join(temp_dir, "data.db")
+        write_synthetic_database(
+            database_location, n_homes=args.n_homes, n_days=args.n_days, triggers_per_day=args.triggers_per_day
+        )
+        add_train_valid_test_split_table(database_location)
+        _drop_indexes(database_location)
+        unindexed = _time_joins(database_location, args.repeats)
+        prepare_database(database_location)
+        prepared = _time_joins(database_location, args.repeats)
+        close_connections(database_location)
+
+    print(f"{'query':<24}{'unindexed (s)':>16}{'prepared (s)':>16}{'speedup':>10}")
+    for query, unindexed_time in unindexed.items():
+        print(f"{query:<24}{unindexed_time:>16.3f}{prepared[query]:>16.3f}{unindexed_time / prepared[query]:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
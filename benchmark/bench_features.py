@@ -0,0 +1,43 @@
+"""
+Scaling of add_all_features_partitioned over worker counts on a synthetic database.
+
+python -m benchmark.bench_features --n-homes 2000 --workers 1 2 4 8
+"""
+
+import argparse
+import time
+
+from benchmark.synthetic import split_synthetic_database
+from lib.data.features import add_all_features_partitioned, read_raw_data
+
+MULTI_LOCATION_WINDOWS = ["5min", "30min", "1h", "2h"]
+
+
+def main() -> None:
+    """Run the benchmark and print a table of results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-homes", type=int, default=500)
+    parser.add_argument("--n-locations", type=int, default=8)
+    parser.add_argument("--n-days", type=int, default=7)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    with split_synthetic_database(
+        n_homes=args.n_homes, n_locations=args.n_locations, n_days=args.n_days
+    ) as database_location:
+        raw_data = read_raw_data(database_location, train=True, valid=True, test=True)
+    locations = sorted(set(raw_data["location"]))
+
+    print(f"{'workers':>8}{'rows':>12}{'seconds':>10}{'speedup':>10}{'efficiency':>12}")
+    serial_seconds = None
+    for n_jobs in args.workers:
+        start = time.perf_counter()
+        features = add_all_features_partitioned(raw_data, MULTI_LOCATION_WINDOWS, locations, n_jobs=n_jobs)
+        seconds = time.perf_counter() - start
+        serial_seconds = serial_seconds or seconds
+        speedup = serial_seconds / seconds
+        print(f"{n_jobs:>8}{len(features):>12}{seconds:>10.2f}{speedup:>10.2f}{speedup / n_jobs:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Import time of the lib modules in fresh interpreters, and the heavy dependencies each import pulls in.
+
+python -m benchmark.bench_imports --repeats 5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Any
+
+MODULES = [
+    "lib.data.features",
+    "lib.data.store",
+    "lib.model.fit",
+    "lib.model.serving",
+    "lib.model.stepwise",
+]
+HEAVY_DEPENDENCIES = [
+    "joblib",
+    "numba",
+    "onnxruntime",
+    "pandas",
+    "pyarrow",
+    "scipy",
+    "sklearn",
+    "sklearn.linear_model",
+    "sklearn.metrics",
+    "sklearn.model_selection",
+    "sklearn.tree",
+]
+
+_IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {dependencies!r} if name in sys.modules]}}))
+"""
+
+
+def measure_import(module: str, repeats: int = 3) -> dict[str, Any]:
+    """
+    Median wall time of importing `module` in a new interpreter, and the heavy dependencies it loaded.
+    """
+    runs = []
+    for _ in range(repeats):
+        script = _IMPORT_SCRIPT.format(module=module, dependencies=HEAVY_DEPENDENCIES)
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return {"seconds": statistics.median(run["seconds"] for run in runs), "loaded": runs[-1]["loaded"]}
+
+
+def main() -> None:
+    """Run the benchmark and print a table of results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    args = parser.parse_args()
+
+    print(f"{'module':<24}{'seconds':>10}  heavy dependencies")
+    for module in args.modules:
+        result = measure_import(module, args.repeats)
+        print(f"{module:<24}{result['seconds']:>10.3f}  {', '.join(result['loaded'])}")
+
+
+if __name__ == "__main__":
+    main()
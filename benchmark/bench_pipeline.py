@@ -0,0 +1,215 @@
+"""
+Wall time and peak memory of each data and model pipeline stage on synthetic databases of increasing size.
+
+python -m benchmark.bench_pipeline --scales 1 2 4 --output results.json --baseline baseline.json
+
+Every stage runs in a forked child process given the output of the previous stages, so its peak resident memory is
+measured on its own. `peak_rss_mb` includes the inputs inherited from the parent, `stage_rss_mb` only the memory
+allocated by the stage. Import times of the lib modules are measured in fresh interpreters.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from typing import Any, Callable
+
+import numpy as np
+from sklearn.tree import DecisionTreeClassifier
+
+from benchmark.bench_imports import MODULES, measure_import
+from benchmark.synthetic import write_synthetic_database
+from lib.common.database import close_connections
+from lib.data.dtypes import COMPACT_DTYPES
+from lib.data.features import (
+    add_all_features,
+    add_cumulative_triggers,
+    add_elapsed_time,
+    add_multiple_location_triggers_in_windows,
+    read_raw_data,
+    transform_sensor_triggers_to_time_series,
+)
+from lib.data.split import add_train_valid_test_split_table
+from lib.data.warmup import post_warmup_locator
+from lib.model.stepwise import StepwiseFeatureSelector
+
+MULTI_LOCATION_WINDOWS = ["5min", "30min", "1h", "2h"]
+FEATURES = [f"multiple_room_triggers_{window}_per_hour" for window in MULTI_LOCATION_WINDOWS] + [
+    "total_all_locations_per_hour",
+    "bathroom_proportion",
+]
+# relative increase in a metric above which a stage is reported as a regression
+DEFAULT_TOLERANCE = 0.25
+_PAGE_SIZE_MB = os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def _current_rss_mb() -> float:
+    with open("/proc/self/statm", encoding="utf-8") as f:
+        return int(f.read().split()[1]) * _PAGE_SIZE_MB
+
+
+def _run_stage(stage: Callable[[], Any], sender) -> None:
+    start_rss_mb = _current_rss_mb()
+    start = time.perf_counter()
+    stage()
+    seconds = time.perf_counter() - start
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    sender.send({"seconds": seconds, "peak_rss_mb": peak_rss_mb, "stage_rss_mb": peak_rss_mb - start_rss_mb})
+
+
+def measure_stage(stage: Callable[[], Any]) -> dict[str, float]:
+    """
+    Wall time and peak resident memory of `stage`, run in a forked child process.
+    """
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_stage, args=(stage, sender))
+    process.start()
+    # only the child may hold the sending end, so a child that dies before sending closes the pipe
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = None
+    process.join()
+    if result is None or process.exitcode != 0:
+        raise RuntimeError(f"Benchmark stage failed with exit code {process.exitcode}")
+    return result
+
+
+def benchmark_scale(database_location: str, n_homes: int, args: argparse.Namespace) -> list[dict[str, Any]]:
+    """
+    Measure every stage on a synthetic database with `n_homes` homes.
+    """
+    write_synthetic_database(
+        database_location,
+        n_homes=n_homes,
+        n_locations=args.n_locations,
+        n_days=args.n_days,
+        triggers_per_day=args.triggers_per_day,
+        sensors_per_home=args.sensors_per_home,
+    )
+    add_train_valid_test_split_table(database_location)
+    results = []
+
+    def record(stage_name: str, stage: Callable[[], Any], n_rows: int) -> None:
+        result = {"n_homes": n_homes, "stage": stage_name, "n_rows": n_rows, **measure_stage(stage)}
+        print(
+            f"{n_homes:>8}{stage_name:>44}{n_rows:>12}{result['seconds']:>10.2f}"
+            f"{result['peak_rss_mb']:>10.0f}{result['stage_rss_mb']:>10.0f}"
+        )
+        results.append(result)
+
+    close_connections(database_location)
+    record("read_raw_data", lambda: read_raw_data(database_location, train=True), 0)
+    raw_data = read_raw_data(database_location, train=True)
+    locations = list(set(raw_data["location"]))
+    results[-1]["n_rows"] = len(raw_data)
+
+    record(
+        "transform_sensor_triggers_to_time_series",
+        lambda: transform_sensor_triggers_to_time_series(raw_data),
+        len(raw_data),
+    )
+    time_series = transform_sensor_triggers_to_time_series(raw_data)
+    record(
+        "add_multiple_location_triggers_in_windows",
+        lambda: add_multiple_location_triggers_in_windows(time_series, MULTI_LOCATION_WINDOWS, locations),
+        len(time_series),
+    )
+    time_series = add_multiple_location_triggers_in_windows(time_series, MULTI_LOCATION_WINDOWS, locations)
+    columns_to_sum = locations + [f"multiple_room_triggers_{window}" for window in MULTI_LOCATION_WINDOWS]
+    record("add_cumulative_triggers", lambda: add_cumulative_triggers(time_series, columns_to_sum), len(time_series))
+    record("add_elapsed_time", lambda: add_elapsed_time(time_series), len(time_series))
+    record("add_all_features", lambda: add_all_features(raw_data, MULTI_LOCATION_WINDOWS), len(raw_data))
+    record(
+        "add_all_features(append_only=True)",
+        lambda: add_all_features(raw_data, MULTI_LOCATION_WINDOWS, append_only=True),
+        len(raw_data),
+    )
+    record(
+        "add_all_features(compact dtypes)",
+        lambda: add_all_features(raw_data, MULTI_LOCATION_WINDOWS, append_only=True, dtypes=COMPACT_DTYPES),
+        len(raw_data),
+    )
+
+    features = add_all_features(raw_data, MULTI_LOCATION_WINDOWS)
+    locator = post_warmup_locator(features, minimum_observations=5, minimum_elapsed_time_hours=1.0)
+    X = features.loc[locator, FEATURES].to_numpy(dtype=np.float32)
+    y = features.loc[locator, "multiple_occupancy"].to_numpy(dtype=np.float32)
+    del raw_data, time_series, features
+    selector = StepwiseFeatureSelector(estimator=DecisionTreeClassifier(max_depth=2))
+    record("StepwiseFeatureSelector.fit", lambda: selector.fit(X, y), len(X))
+    close_connections(database_location)
+    return results
+
+
+def compare_to_baseline(results: list[dict[str, Any]], baseline: list[dict[str, Any]], tolerance: float) -> list[str]:
+    """
+    Stages whose wall time or peak memory grew by more than `tolerance` relative to the baseline run.
+    """
+    baseline_by_stage = {(result["n_homes"], result["stage"]): result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = baseline_by_stage.get((result["n_homes"], result["stage"]))
+        if previous is None:
+            continue
+        for metric in ["seconds", "peak_rss_mb"]:
+            if result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{result['stage']} with {result['n_homes']} homes: {metric} {previous[metric]:.2f} -> "
+                    f"{result[metric]:.2f}"
+                )
+    return regressions
+
+
+def main() -> None:
+    """Run the benchmark suite, write the results and compare them to a baseline"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n-homes", type=int, default=40, help="homes at scale 1")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1.0, 2.0, 4.0])
+    parser.add_argument("--n-locations", type=int, default=8)
+    parser.add_argument("--sensors-per-home", type=int, default=None)
+    parser.add_argument("--n-days", type=int, default=7)
+    parser.add_argument("--triggers-per-day", type=int, default=300)
+    parser.add_argument("--output", default=None, help="write results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    print(f"{'homes':>8}{'stage':>44}{'rows':>12}{'seconds':>10}{'peak MB':>10}{'stage MB':>10}")
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for scale in args.scales:
+            database_location = os.path.join(temp_dir, f"scale_{scale}.db")
+            results += benchmark_scale(database_location, int(args.n_homes * scale), args)
+
+    imports = {module: measure_import(module) for module in MODULES}
+    for module, result in imports.items():
+        print(f"import {module:<38}{result['seconds']:>32.2f}")
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key not in ["output", "baseline"]},
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "results": results,
+        "imports": imports,
+    }
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline is not None and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_to_baseline(results, json.load(f)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Latency and throughput of OnnxScoringService under many concurrent callers.
+
+python -m benchmark.bench_serving --n-requests 100000 --concurrency 512
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from skl2onnx import to_onnx
+from sklearn.datasets import make_classification
+from sklearn.tree import DecisionTreeClassifier
+
+from lib.model.serving import OnnxScoringService
+
+
+async def _client(service: OnnxScoringService, X: np.ndarray) -> None:
+    for features in X:
+        await service.score(features)
+
+
+async def _run(service: OnnxScoringService, X: np.ndarray, concurrency: int) -> float:
+    async with service:
+        start = time.perf_counter()
+        await asyncio.gather(*(_client(service, X_client) for X_client in np.array_split(X, concurrency)))
+        return time.perf_counter() - start
+
+
+def main() -> None:
+    """Run the benchmark and print the service statistics"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-latency-ms", type=float, default=2.0)
+    parser.add_argument("--n-sessions", type=int, default=1)
+    parser.add_argument("--intra-op-num-threads", type=int, default=1)
+    args = parser.parse_args()
+
+    X, y = make_classification(n_samples=args.n_requests, n_features=6, random_state=0)
+    X = X.astype(np.float32)
+    classifier = DecisionTreeClassifier(max_depth=2).fit(X, y)
+    onx = to_onnx(classifier, X[:1], target_opset=12, options={"zipmap": False})
+    service = OnnxScoringService(
+        onx.SerializeToString(),
+        max_batch_size=args.max_batch_size,
+        max_latency_ms=args.max_latency_ms,
+        n_sessions=args.n_sessions,
+        intra_op_num_threads=args.intra_op_num_threads,
+    )
+    seconds = asyncio.run(_run(service, X, args.concurrency))
+    print(f"{args.n_requests} requests from {args.concurrency} callers in {seconds:.2f}s")
+    for name, value in service.stats().items():
+        print(f"{name:<24}{value:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
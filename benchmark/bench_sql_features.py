@@ -0,0 +1,50 @@
+"""
+Runtime and transfer volume of building features in pandas from raw rows versus in SQLite with window functions.
+
+python -m benchmark.bench_sql_features --n-homes 500
+"""
+
+import argparse
+import time
+
+from benchmark.synthetic import split_synthetic_database
+from lib.data.features import add_all_features, read_locations, read_raw_data
+from lib.data.sql_features import read_all_features_sql
+
+MULTI_LOCATION_WINDOWS = ["5min", "30min", "1h", "2h"]
+MODEL_COLUMNS = [f"multiple_room_triggers_{window}_per_hour" for window in MULTI_LOCATION_WINDOWS] + [
+    "total_all_locations_per_hour",
+    "bathroom_proportion",
+]
+
+
+def main() -> None:
+    """Run the benchmark and print a table of results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-homes", type=int, default=200)
+    parser.add_argument("--n-locations", type=int, default=8)
+    parser.add_argument("--n-days", type=int, default=7)
+    args = parser.parse_args()
+
+    with split_synthetic_database(
+        n_homes=args.n_homes, n_locations=args.n_locations, n_days=args.n_days
+    ) as database_location:
+        locations = read_locations(database_location)
+
+        print(f"{'backend':<24}{'rows read':>12}{'MB read':>10}{'seconds':>10}")
+        start = time.perf_counter()
+        raw_data = read_raw_data(database_location, train=True)
+        add_all_features(raw_data, MULTI_LOCATION_WINDOWS, locations)
+        seconds = time.perf_counter() - start
+        megabytes = raw_data.memory_usage(deep=True).sum() / 2**20
+        print(f"{'pandas':<24}{len(raw_data):>12}{megabytes:>10.1f}{seconds:>10.2f}")
+        for name, columns in [("sql", None), ("sql (model columns)", MODEL_COLUMNS)]:
+            start = time.perf_counter()
+            features = read_all_features_sql(database_location, MULTI_LOCATION_WINDOWS, train=True, columns=columns)
+            seconds = time.perf_counter() - start
+            megabytes = features.memory_usage(deep=True).sum() / 2**20
+            print(f"{name:<24}{len(features):>12}{megabytes:>10.1f}{seconds:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Scaling of StepwiseFeatureSelector over worker counts for each parallel backend.
+
+python -m benchmark.bench_stepwise --n-rows 1000000 --workers 1 4 16 32
+"""
+
+import argparse
+import time
+
+import numpy as np
+from sklearn.datasets import make_classification
+from sklearn.linear_model import LogisticRegression
+from sklearn.tree import DecisionTreeClassifier
+
+from lib.model.stepwise import BACKENDS, StepwiseFeatureSelector
+
+ESTIMATORS = {
+    "lr": LogisticRegression,
+    "dt_shallow": lambda: DecisionTreeClassifier(max_depth=2),
+}
+
+
+def main() -> None:
+    """Run the benchmark and print a table of results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-rows", type=int, default=200_000)
+    parser.add_argument("--n-features", type=int, default=12)
+    parser.add_argument("--estimator", choices=list(ESTIMATORS), default="dt_shallow")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--n-bins", type=int, default=None, help="pre-bin features for decision trees")
+    parser.add_argument("--racing", action="store_true", help="abandon candidates that can no longer win a round")
+    args = parser.parse_args()
+
+    X, y = make_classification(
+        n_samples=args.n_rows, n_features=args.n_features, n_informative=4, n_redundant=2, random_state=0
+    )
+    X, y = X.astype(np.float32), y.astype(np.float32)
+
+    print(f"{'backend':<16}{'workers':>8}{'seconds':>10}{'speedup':>10}{'fits':>8}{'skipped':>8}  selected")
+    for backend in BACKENDS:
+        serial_seconds = None
+        for n_jobs in args.workers:
+            selector = StepwiseFeatureSelector(
+                estimator=ESTIMATORS[args.estimator](),
+                n_jobs=n_jobs,
+                backend=backend,
+                n_bins=args.n_bins,
+                racing=args.racing,
+            )
+            start = time.perf_counter()
+            selector.fit(X, y)
+            seconds = time.perf_counter() - start
+            serial_seconds = serial_seconds or seconds
+            speedup = serial_seconds / seconds
+            n_fits = sum(stats["n_fits"] for stats in selector.round_stats_)
+            n_skipped = sum(stats["n_fits_skipped"] for stats in selector.round_stats_)
+            print(
+                f"{backend:<16}{n_jobs:>8}{seconds:>10.2f}{speedup:>10.2f}{n_fits:>8}{n_skipped:>8}"
+                f"  {selector.selected_features_}"
+            )
+
+
+if __name__ == "__main__":
+    main()
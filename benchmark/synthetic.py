@@ -0,0 +1,96 @@
+"""
+Synthetic sensor database with the same tables as the downloaded raw data, so benchmarks need no download.
+"""
+
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from lib.common.tables import HOMES_TABLE, MOTION_TABLE
+from lib.data.split import add_train_valid_test_split_table
+
+_LOCATIONS = ["bathroom1", "WC1", "bedroom1", "bedroom2", "kitchen", "lounge", "hallway", "conservatory"]
+_START = pd.Timestamp("2024-01-01", tz="UTC")
+
+
+def synthetic_locations(n_locations: int) -> list[str]:
+    """Location names, starting with the ones used by the features"""
+    return (_LOCATIONS + [f"room{i}" for i in range(len(_LOCATIONS), n_locations)])[:n_locations]
+
+
+def _trigger_locations(
+    rng: np.random.Generator, n_triggers: np.ndarray, n_locations: int, sensors_per_home: Optional[int]
+) -> tuple[np.ndarray, np.ndarray]:
+    """Home and location index of every trigger, drawn from a random subset of locations per home"""
+    # the first two synthetic locations are the bathrooms, which every home has
+    sensors_per_home = n_locations if sensors_per_home is None else min(sensors_per_home, n_locations)
+    home_locations = np.array(
+        [
+            np.concatenate([[0, 1], rng.permutation(np.arange(2, n_locations))])[:sensors_per_home]
+            for _ in range(len(n_triggers))
+        ]
+    )
+    home_index = np.repeat(np.arange(len(n_triggers)), n_triggers)
+    return home_index, home_locations[home_index, rng.integers(0, sensors_per_home, len(home_index))]
+
+
+def write_synthetic_database(  # pylint: disable=too-many-arguments
+    database_location: str,
+    *,
+    n_homes: int = 100,
+    n_locations: int = 8,
+    n_days: int = 7,
+    triggers_per_day: int = 300,
+    sensors_per_home: Optional[int] = None,
+    seed: int = 0,
+) -> None:
+    """
+    Write the homes and motion tables with sensor triggers at minute resolution.
+    Each home has `sensors_per_home` of the locations (all by default, always including the bathrooms) and multiple
+    occupancy homes trigger 50% more often than the `triggers_per_day` of single occupancy homes.
+    Motion rows are ordered by time across homes, as if they were appended as they arrived.
+    """
+    rng = np.random.default_rng(seed)
+    home_ids = np.array([f"home_{i:06d}" for i in range(n_homes)])
+    multiple_occupancy = rng.integers(0, 2, n_homes)
+    homes = pd.DataFrame({"id": home_ids, "multiple_occupancy": multiple_occupancy})
+
+    home_index, location_index = _trigger_locations(
+        rng,
+        (n_days * triggers_per_day * (1 + 0.5 * multiple_occupancy)).astype(np.int64),
+        n_locations,
+        sensors_per_home,
+    )
+    motion = pd.DataFrame(
+        {
+            "home_id": home_ids[home_index],
+            "datetime": _START + pd.to_timedelta(rng.integers(0, n_days * 24 * 60, len(home_index)), unit="min"),
+            "location": np.array(synthetic_locations(n_locations))[location_index],
+        }
+    ).sort_values("datetime", kind="stable", ignore_index=True)
+    motion.insert(0, "id", np.arange(len(motion)).astype(str))
+    motion["datetime"] = motion["datetime"].dt.strftime("%Y-%m-%d %H:%M:%S")
+
+    conn = sqlite3.connect(database_location)
+    homes.to_sql(HOMES_TABLE, conn, index=False, if_exists="replace")
+    motion.to_sql(MOTION_TABLE, conn, index=False, if_exists="replace", chunksize=100_000)
+    conn.commit()
+    conn.close()
+
+
+@contextmanager
+def split_synthetic_database(**kwargs: Any) -> Iterator[str]:
+    """
+    Location of a temporary synthetic database, written with `kwargs` and split into the train, valid and test sets,
+    that is removed on exit.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database_location = os.path.join(temp_dir, "synthetic.db")
+        write_synthetic_database(database_location, **kwargs)
+        add_train_valid_test_split_table(database_location)
+        yield database_location
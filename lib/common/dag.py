@@ -0,0 +1,160 @@
+"""
+Run a graph of stages whose outputs are cached as content-hashed artifacts.
+
+Each stage writes one artifact file. Its key hashes the source of the module defining the stage and of the modules in
+its `code`, its parameters and the SHA-256 digests of its input artifacts, so a stage is skipped when an artifact with
+the same key exists, and downstream stages are skipped when a rerun stage produced identical bytes. Stages whose
+inputs are outside the graph, such as a database that may change, set `always_run` and their dependents are skipped
+while their artifact is unchanged.
+"""
+
+import glob
+import json
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from lib.common.download import file_sha256
+from lib.common.hashing import module_sources, stable_hash
+from lib.common.logging import get_logger
+
+_LOGGER = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    `func(inputs, output, **params)` is given the artifact path of every stage in `inputs` by name and must write its
+    own artifact to `output`. `code` names the modules, other than the one defining `func`, whose source the artifact
+    depends on.
+    """
+
+    name: str
+    func: Callable[..., None]
+    inputs: tuple[str, ...] = ()
+    params: dict[str, Any] = field(default_factory=dict)
+    suffix: str = ".pkl"
+    always_run: bool = False
+    code: tuple[str, ...] = ()
+
+
+def _stage_key(stage: Stage, input_digests: dict[str, str]) -> str:
+    code = module_sources([stage.func.__module__, *stage.code])
+    return stable_hash({"code": code, "params": stage.params, "inputs": input_digests})
+
+
+def _run_stage(stage: Stage, inputs: dict[str, str], output: str) -> str:
+    temp_output = output + ".tmp" + stage.suffix
+    stage.func(inputs, temp_output, **stage.params)
+    os.replace(temp_output, output)
+    return file_sha256(output)
+
+
+class StageGraph:
+    """
+    Stages run as soon as their inputs are ready, up to `n_jobs` at a time in forked worker processes.
+
+    ```
+    graph = StageGraph("artifacts", [Stage("a", write_a), Stage("b", write_b, inputs=("a",))])
+    graph.run()  # {"a": "artifacts/a-<key>.pkl", "b": "artifacts/b-<key>.pkl"}
+    ```
+    """
+
+    def __init__(self, artifact_location: str, stages: list[Stage]):
+        self.artifact_location = artifact_location
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        for stage in stages:
+            missing = [name for name in stage.inputs if name not in self.stages]
+            if missing:
+                raise ValueError(f"Stage {stage.name} depends on unknown stages {missing}")
+        ordered: set[str] = set()
+        while len(ordered) < len(stages):
+            ready = {stage.name for stage in stages if stage.name not in ordered and set(stage.inputs) <= ordered}
+            if not ready:
+                raise ValueError(f"Stages {sorted(set(self.stages) - ordered)} depend on each other")
+            ordered |= ready
+        self.ran: list[str] = []
+        self.skipped: list[str] = []
+
+    def upstream(self, targets: list[str]) -> list[str]:
+        """Names of `targets` and every stage they depend on"""
+        required: set[str] = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in required:
+                required.add(name)
+                pending.extend(self.stages[name].inputs)
+        return [name for name in self.stages if name in required]
+
+    def _artifact_path(self, stage: Stage, key: str) -> str:
+        return os.path.join(self.artifact_location, f"{stage.name}-{key}{stage.suffix}")
+
+    def _cached_digest(self, path: str) -> Optional[str]:
+        manifest_path = path + ".json"
+        if not (os.path.exists(path) and os.path.exists(manifest_path)):
+            return None
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)["sha256"]
+
+    def _record(self, stage: Stage, path: str, digest: str) -> None:
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"stage": stage.name, "sha256": digest}, f)
+        # artifacts of the same stage built from older inputs can never be used again
+        for stale_path in glob.glob(os.path.join(self.artifact_location, f"{stage.name}-*")):
+            if stale_path not in [path, path + ".json"]:
+                os.remove(stale_path)
+
+    def run(self, targets: Optional[list[str]] = None, n_jobs: int = 1) -> dict[str, str]:
+        """
+        Bring `targets` and their upstream stages up to date, all stages by default, and return their artifact paths.
+        """
+        if n_jobs < 1:
+            raise ValueError(f"n_jobs must be at least 1, got {n_jobs}")
+        os.makedirs(self.artifact_location, exist_ok=True)
+        remaining = self.upstream(targets or list(self.stages))
+        paths: dict[str, str] = {}
+        digests: dict[str, str] = {}
+        running: dict[Future, tuple[Stage, str]] = {}
+        self.ran, self.skipped = [], []
+        executor = (
+            ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context("fork"))
+            if n_jobs != 1
+            else None
+        )
+        try:
+            while remaining or running:
+                for name in [name for name in remaining if all(i in digests for i in self.stages[name].inputs)]:
+                    remaining.remove(name)
+                    stage = self.stages[name]
+                    path = self._artifact_path(stage, _stage_key(stage, {i: digests[i] for i in stage.inputs}))
+                    cached_digest = None if stage.always_run else self._cached_digest(path)
+                    if cached_digest is not None:
+                        _LOGGER.info(f"Stage {name} is up to date")
+                        self.skipped.append(name)
+                        paths[name], digests[name] = path, cached_digest
+                        continue
+                    _LOGGER.info(f"Running stage {name}")
+                    inputs = {i: paths[i] for i in stage.inputs}
+                    if executor is None:
+                        self._finish(stage, path, _run_stage(stage, inputs, path), paths, digests)
+                    else:
+                        running[executor.submit(_run_stage, stage, inputs, path)] = (stage, path)
+                if running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        stage, path = running.pop(future)
+                        self._finish(stage, path, future.result(), paths, digests)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        return paths
+
+    def _finish(self, stage: Stage, path: str, digest: str, paths: dict[str, str], digests: dict[str, str]) -> None:
+        self._record(stage, path, digest)
+        self.ran.append(stage.name)
+        paths[stage.name], digests[stage.name] = path, digest
@@ -0,0 +1,52 @@
+"""
+Shared SQLite connections with read optimised settings.
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+READ_PRAGMAS = {
+    "mmap_size": 1 << 30,
+    "cache_size": -(1 << 18),  # negative values are in KiB
+    "temp_store": "MEMORY",
+}
+
+_CONNECTIONS: dict[tuple[str, int, int], sqlite3.Connection] = {}
+_LOCK = threading.Lock()
+
+
+def _connection_key(database_location: str) -> tuple[str, int, int]:
+    # sqlite3 connections must not be used by several threads at once or across forked processes
+    return os.path.abspath(database_location), os.getpid(), threading.get_ident()
+
+
+def get_connection(database_location: str) -> sqlite3.Connection:
+    """
+    Connection to the database that is reused by every caller in the same process and thread.
+    """
+    key = _connection_key(database_location)
+    with _LOCK:
+        conn = _CONNECTIONS.get(key)
+        if conn is None:
+            # only the creating thread uses the connection, other threads may close it in close_connections
+            conn = sqlite3.connect(database_location, check_same_thread=False)
+            for pragma, value in READ_PRAGMAS.items():
+                conn.execute(f"PRAGMA {pragma}={value}")
+            _CONNECTIONS[key] = conn
+    return conn
+
+
+def close_connections(database_location: Optional[str] = None) -> None:
+    """
+    Close shared connections to a database, or to all databases if no location is given, including those of other
+    threads, which must not be using them. Connections inherited from a parent process are dropped without closing.
+    Must be called before the database file is replaced.
+    """
+    path = None if database_location is None else os.path.abspath(database_location)
+    with _LOCK:
+        for key in [key for key in _CONNECTIONS if path is None or key[0] == path]:
+            conn = _CONNECTIONS.pop(key)
+            if key[1] == os.getpid():
+                conn.close()
@@ -0,0 +1,102 @@
+"""
+Streaming downloads that resume after dropped connections and never leave a partial file at the destination.
+"""
+
+import hashlib
+import os
+import time
+from typing import Optional
+
+import requests
+
+from lib.common.logging import get_logger
+
+_LOGGER = get_logger(__name__)
+
+# server errors and rate limiting are worth retrying, other HTTP errors are not
+_RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Hex SHA-256 digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _expected_size(response: requests.Response, offset: int) -> Optional[int]:
+    content_range = response.headers.get("Content-Range")
+    if response.status_code == 206 and content_range is not None and not content_range.endswith("/*"):
+        return int(content_range.rsplit("/", 1)[1])
+    content_length = response.headers.get("Content-Length")
+    return None if content_length is None else int(content_length) + offset
+
+
+def _download_part(url: str, part_path: str, chunk_size: int, timeout: float) -> bool:
+    """
+    Append the rest of `url` to `part_path`, returning whether the file is complete.
+    """
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with requests.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 416:
+            # the range starts at or beyond the end, so either everything was already downloaded or the file changed
+            total = response.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+            if total.isdigit() and int(total) == offset:
+                return True
+            os.remove(part_path)
+            return False
+        response.raise_for_status()
+        if response.status_code != 206:
+            # the server ignored the range, so start again from the first byte
+            offset = 0
+        expected_size = _expected_size(response, offset)
+        with open(part_path, "ab" if offset else "wb") as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+    return expected_size is None or os.path.getsize(part_path) == expected_size
+
+
+def download_file(  # pylint: disable=too-many-arguments
+    url: str,
+    destination: str,
+    *,
+    sha256: Optional[str] = None,
+    max_retries: int = 5,
+    backoff_seconds: float = 1.0,
+    chunk_size: int = 1 << 20,
+    timeout: float = 30.0,
+) -> str:
+    """
+    Stream `url` to `destination` and return its SHA-256 digest.
+
+    Chunks are appended to `destination + ".part"`, which is resumed with an HTTP range request after a dropped
+    connection and after an earlier interrupted call. Failed attempts are retried `max_retries` times with exponential
+    backoff. The file is only renamed to `destination` once it is complete and matches `sha256`, when given.
+    """
+    part_path = destination + ".part"
+    for attempt in range(max_retries + 1):
+        try:
+            if _download_part(url, part_path, chunk_size, timeout):
+                break
+            _LOGGER.info(f"Download of {url} ended early, resuming")
+        except requests.HTTPError as error:
+            if error.response is None or error.response.status_code not in _RETRY_STATUS_CODES:
+                raise
+            _LOGGER.info(f"Download of {url} failed on attempt {attempt + 1}: {error!r}")
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as error:
+            _LOGGER.info(f"Download of {url} failed on attempt {attempt + 1}: {error!r}")
+        if attempt == max_retries:
+            raise requests.ConnectionError(f"Download of {url} did not complete after {max_retries + 1} attempts")
+        time.sleep(backoff_seconds * 2**attempt)
+
+    digest = file_sha256(part_path, chunk_size)
+    if sha256 is not None and digest != sha256.lower():
+        os.remove(part_path)
+        raise ValueError(f"Checksum of {url} is {digest}, expected {sha256}")
+    os.replace(part_path, destination)
+    return digest
@@ -0,0 +1,19 @@
+"""
+Short stable hashes used to key cached artifacts by the values and source code they were built from.
+"""
+
+import hashlib
+import importlib
+import inspect
+import json
+from typing import Any, Iterable
+
+
+def stable_hash(value: Any) -> str:
+    """First 16 hex characters of the SHA-256 digest of `value` serialised as JSON with sorted keys"""
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def module_sources(modules: Iterable[str]) -> dict[str, str]:
+    """Source code of each named module, reread when the file changes"""
+    return {module: inspect.getsource(importlib.import_module(module)) for module in modules}
@@ -0,0 +1,209 @@
+"""
+Timing and memory instrumentation of pipeline stages.
+
+Nothing is measured until a sink is added, so instrumented functions only pay for an empty list check by default.
+
+```
+with recording(MemorySink()) as sink:
+    add_all_features(raw_data, ["2h"])
+sink.records  # one StageRecord per instrumented call
+```
+"""
+
+import functools
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+from lib.common.logging import get_logger
+
+_LOGGER = get_logger(__name__)
+
+Sink = Callable[["StageRecord"], None]
+_SINKS: list[Sink] = []
+_STACK = threading.local()
+_F = TypeVar("_F", bound=Callable[..., Any])
+_S = TypeVar("_S", bound=Sink)
+
+
+@dataclass
+class StageRecord:  # pylint: disable=too-many-instance-attributes
+    """
+    Measurements of a single run of a stage.
+
+    `peak_rss_mb` is the peak resident memory of the process while the stage ran, including memory allocated before
+    it started. It is only specific to the stage on Linux, where the peak can be reset, and is otherwise the peak of
+    the process so far.
+    """
+
+    stage: str
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_rss_mb: float = 0.0
+    parent: Optional[str] = None
+    extra: dict[str, Any] = field(default_factory=dict)
+
+
+def _read_peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # kilobytes on Linux, bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024**2 if sys.platform == "darwin" else 1024)
+
+
+def _reset_peak_rss() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+@functools.lru_cache(maxsize=None)
+def peak_rss_is_per_stage() -> bool:
+    """Whether the peak memory of each stage is measured on its own, which needs a writable /proc/self/clear_refs"""
+    return _reset_peak_rss()
+
+
+def _stack() -> list[StageRecord]:
+    if not hasattr(_STACK, "records"):
+        _STACK.records = []
+    return _STACK.records
+
+
+def n_rows(value: Any) -> Optional[int]:
+    """Number of rows of frames and arrays, None for anything else"""
+    shape = getattr(value, "shape", None)
+    return shape[0] if shape else None
+
+
+def add_sink(sink: _S) -> _S:
+    """Start sending stage records to `sink`"""
+    _SINKS.append(sink)
+    return sink
+
+
+def remove_sink(sink: Sink) -> None:
+    """Stop sending stage records to `sink`"""
+    _SINKS.remove(sink)
+
+
+def is_enabled() -> bool:
+    """Whether any sink is receiving stage records"""
+    return bool(_SINKS)
+
+
+@contextmanager
+def recording(sink: _S) -> Iterator[_S]:
+    """Send stage records to `sink` for the duration of the block"""
+    add_sink(sink)
+    try:
+        yield sink
+    finally:
+        remove_sink(sink)
+
+
+@contextmanager
+def stage(name: str, rows_in: Optional[int] = None, **extra) -> Iterator[StageRecord]:
+    """
+    Measure the block as one run of stage `name`.
+    Set `rows_out` or add to `extra` on the yielded record to report them.
+    """
+    if not _SINKS:
+        yield StageRecord(stage=name, rows_in=rows_in, extra=extra)
+        return
+    stack = _stack()
+    record = StageRecord(stage=name, rows_in=rows_in, parent=stack[-1].stage if stack else None, extra=extra)
+    if stack:
+        # the enclosing stage keeps the peak reached before it is reset for this one
+        stack[-1].peak_rss_mb = max(stack[-1].peak_rss_mb, _read_peak_rss_mb())
+    _reset_peak_rss()
+    stack.append(record)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        record.wall_seconds = time.perf_counter() - wall_start
+        record.cpu_seconds = time.process_time() - cpu_start
+        record.peak_rss_mb = max(record.peak_rss_mb, _read_peak_rss_mb())
+        stack.pop()
+        if stack:
+            stack[-1].peak_rss_mb = max(stack[-1].peak_rss_mb, record.peak_rss_mb)
+        for sink in list(_SINKS):
+            sink(record)
+
+
+def instrument(name: Optional[str] = None) -> Callable[[_F], _F]:
+    """
+    Decorator measuring every call as a stage, named after the function by default.
+    Rows in and out are taken from the first argument and the result when they are frames or arrays.
+    """
+
+    def decorator(func: _F) -> _F:
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _SINKS:
+                return func(*args, **kwargs)
+            with stage(stage_name, rows_in=n_rows(args[0]) if args else None) as record:
+                result = func(*args, **kwargs)
+                record.rows_out = n_rows(result)
+            return result
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+class MemorySink:  # pylint: disable=too-few-public-methods
+    """Keeps every record in `records`, for tests and notebooks"""
+
+    def __init__(self) -> None:
+        self.records: list[StageRecord] = []
+
+    def __call__(self, record: StageRecord) -> None:
+        self.records.append(record)
+
+
+class LogSink:  # pylint: disable=too-few-public-methods
+    """Logs one line per record"""
+
+    def __init__(self, logger: logging.Logger = _LOGGER, level: int = logging.INFO) -> None:
+        self.logger = logger
+        self.level = level
+
+    def __call__(self, record: StageRecord) -> None:
+        rows = "" if record.rows_in is None else f" rows {record.rows_in} -> {record.rows_out}"
+        self.logger.log(
+            self.level,
+            f"{record.stage}: {record.wall_seconds:.3f}s wall {record.cpu_seconds:.3f}s cpu "
+            f"peak {record.peak_rss_mb:.0f} MB{rows}",
+        )
+
+
+class JsonLinesSink:  # pylint: disable=too-few-public-methods
+    """Appends one JSON object per record to `path`, safe to share with forked worker processes"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def __call__(self, record: StageRecord) -> None:
+        line = json.dumps({**asdict(record), "pid": os.getpid(), "time": time.time()}, default=str)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
@@ -8,3 +8,5 @@ ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)
 DATA = os.path.join(ROOT, "data")
 _DATABASE_NAME = "data.db"
 DATABASE_LOCATION = os.path.join(DATA, _DATABASE_NAME)
+FEATURE_STORE_LOCATION = os.path.join(DATA, "features")
+ARTIFACT_LOCATION = os.path.join(DATA, "artifacts")
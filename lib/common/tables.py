@@ -1,22 +1,73 @@
-import sqlite3
+import hashlib
+
+from lib.common.database import get_connection
 
 HOMES_TABLE = "homes"
 MOTION_TABLE = "motion"
 TRAIN_VALID_TEST_TABLE = "train_valid_test"
 
+_INDEXES = {
+    f"idx_{MOTION_TABLE}_home_id_datetime": (MOTION_TABLE, ["home_id", "datetime"]),
+    f"idx_{HOMES_TABLE}_id": (HOMES_TABLE, ["id"]),
+    f"idx_{TRAIN_VALID_TEST_TABLE}_home_id": (TRAIN_VALID_TEST_TABLE, ["home_id"]),
+}
+
+
+def _table_exists(database_location: str, table_name: str) -> bool:
+    cursor = get_connection(database_location).cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+    return cursor.fetchone() is not None
+
 
 def table_has_data(database_location: str, table_name: str):
     """
     Check if there is at least one row from the table.
     """
-    conn = sqlite3.connect(database_location)
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-    table_exists = cursor.fetchone()
-
-    if table_exists:
+    if _table_exists(database_location, table_name):
+        cursor = get_connection(database_location).cursor()
         cursor.execute(f"SELECT 1 FROM {table_name} LIMIT 1")
         row_exists = cursor.fetchone()
         return row_exists
     return False
+
+
+def table_checksum(database_location: str, table_name: str, chunk_rows: int = 1_000_000) -> str:
+    """
+    SHA-256 of every row of a table in rowid order, which changes on any insert, update or delete.
+    Rows are concatenated by SQLite in chunks of `chunk_rows` rowids to bound memory.
+    """
+    conn = get_connection(database_location)
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+    row_sql = " || char(31) || ".join(["rowid"] + [f"ifnull(\"{column}\", '')" for column in columns])
+    chunk_sql = f"""
+    select group_concat(row, char(30)) from (
+        select {row_sql} as row from {table_name} where rowid between ? and ? order by rowid
+    )
+    """
+    digest = hashlib.sha256()
+    first, last = conn.execute(f"SELECT min(rowid), max(rowid) FROM {table_name}").fetchone()
+    if first is not None:
+        for start in range(first, last + 1, chunk_rows):
+            (chunk,) = conn.execute(chunk_sql, (start, start + chunk_rows - 1)).fetchone()
+            if chunk is not None:
+                digest.update(chunk.encode() + b"\x1e")
+    return digest.hexdigest()
+
+
+def prepare_database(database_location: str) -> None:
+    """
+    Switch to write-ahead logging and add the indexes used when joining raw data.
+    Safe to call repeatedly, tables that do not exist yet are skipped.
+    """
+    conn = get_connection(database_location)
+    conn.execute("PRAGMA journal_mode=WAL")
+    existing_indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    created_index = False
+    for index_name, (table_name, columns) in _INDEXES.items():
+        if index_name not in existing_indexes and _table_exists(database_location, table_name):
+            conn.execute(f"CREATE INDEX {index_name} ON {table_name} ({', '.join(columns)})")
+            created_index = True
+    if created_index:
+        # refresh planner statistics so the new indexes are used for the joins
+        conn.execute("ANALYZE")
+    conn.commit()
@@ -0,0 +1,49 @@
+"""
+Dtype policies for raw data and feature frames.
+
+`DEFAULT_DTYPES` keeps the pandas defaults, `COMPACT_DTYPES` stores indicators as uint8, counts as int32, rates as
+float32 and ids and locations as categoricals, which is all the model and ONNX inference need.
+"""
+
+from dataclasses import dataclass
+
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class DtypePolicy:
+    """
+    Dtypes of each kind of column.
+
+    `indicator`: multiple occupancy, location triggers and multiple room triggers
+    `count`: cumulative counts
+    `rate`: elapsed time, rates and proportions
+    `categorical`: store home ids and locations as categoricals rather than strings
+    """
+
+    indicator: str = "int64"
+    count: str = "int64"
+    rate: str = "float64"
+    categorical: bool = False
+
+    def raw_schema(self) -> dict[str, str]:
+        """Dtypes of the raw data columns"""
+        text_dtype = "category" if self.categorical else "str"
+        return {
+            "multiple_occupancy": self.indicator,
+            "home_id": text_dtype,
+            "id": "str",
+            "location": text_dtype,
+            "datetime": "datetime64[ns, UTC]",
+        }
+
+    def apply_to_keys(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """Cast `home_id` and `multiple_occupancy` of a feature frame, in place"""
+        if self.categorical and not isinstance(frame["home_id"].dtype, pd.CategoricalDtype):
+            frame["home_id"] = frame["home_id"].astype("category")
+        frame["multiple_occupancy"] = frame["multiple_occupancy"].astype(self.indicator, copy=False)
+        return frame
+
+
+DEFAULT_DTYPES = DtypePolicy()
+COMPACT_DTYPES = DtypePolicy(indicator="uint8", count="int32", rate="float32", categorical=True)
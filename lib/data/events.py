@@ -0,0 +1,116 @@
+"""
+Event-native representation of sensor triggers.
+
+Each (home, minute) row stores the triggered locations as bits of the smallest unsigned integer that fits every
+location, or of several uint64 words beyond 64 locations, rather than one dense int64 column per location.
+"""
+
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+TIME_SERIES_INDEX = ["home_id", "datetime", "multiple_occupancy"]
+_BITS_PER_WORD = 64
+
+
+def smallest_unsigned_dtype(max_value: int) -> np.dtype:
+    """Smallest unsigned integer type that can hold `max_value`"""
+    for dtype in map(np.dtype, ["uint8", "uint16", "uint32", "uint64"]):
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    raise ValueError(f"{max_value} does not fit in an unsigned 64 bit integer")
+
+
+def _word_bitmask(codes: np.ndarray, starts: np.ndarray, word: int, dtype: np.dtype) -> np.ndarray:
+    """
+    `word` of the bitmask of each group of location codes starting at `starts`.
+    Codes in other words or missing (-1) set no bits.
+    """
+    word_codes = codes - word * _BITS_PER_WORD
+    in_word = (word_codes >= 0) & (word_codes < _BITS_PER_WORD)
+    bits = np.where(in_word, dtype.type(1) << np.where(in_word, word_codes, 0).astype(dtype), 0).astype(dtype)
+    return np.bitwise_or.reduceat(bits, starts) if len(bits) > 0 else bits
+
+
+@dataclass
+class SensorTriggers:
+    """
+    Sensor triggers per home and minute.
+
+    `keys` holds the `TIME_SERIES_INDEX` columns sorted by home_id and datetime, and bit `i` of `bitmask` is set when
+    `locations[i]` was triggered in that row. Beyond 64 locations `bitmask` has one uint64 column per 64 locations,
+    and bit `i % 64` of column `i // 64` is set instead.
+    """
+
+    keys: pd.DataFrame
+    bitmask: np.ndarray
+    locations: list[str]
+
+    @classmethod
+    def from_raw_data(cls, raw_data: pd.DataFrame, locations: Optional[list[str]] = None) -> "SensorTriggers":
+        """
+        Group raw triggers by home and minute without building a dense pivot table.
+        Triggers in locations outside of `locations` leave their row without any bits set.
+        """
+        if locations is None:
+            locations = list(set(raw_data["location"]))
+        locations = sorted(locations)
+        n_words = max(-(-len(locations) // _BITS_PER_WORD), 1)
+        dtype = smallest_unsigned_dtype(2 ** max(len(locations), 1) - 1) if n_words == 1 else np.dtype(np.uint64)
+        group = raw_data.groupby(TIME_SERIES_INDEX, sort=True, observed=True).ngroup().to_numpy()
+        is_valid = group >= 0
+        group = group[is_valid]
+
+        order = np.argsort(group, kind="stable")
+        sorted_group = group[order]
+        starts = np.flatnonzero(np.concatenate([[True], sorted_group[1:] != sorted_group[:-1]]))[: len(group)]
+        codes = pd.Categorical(raw_data["location"], categories=locations).codes[is_valid][order].astype(np.int64)
+        words = [_word_bitmask(codes, starts, word, dtype) for word in range(n_words)]
+        # column-major, so the word holding each location is contiguous
+        bitmask = words[0] if n_words == 1 else np.array(words).T
+        first_rows = np.flatnonzero(is_valid)[order[starts]]
+        keys = raw_data[TIME_SERIES_INDEX].iloc[first_rows].reset_index(drop=True)
+        return cls(keys=keys, bitmask=bitmask, locations=locations)
+
+    def __len__(self) -> int:
+        return len(self.bitmask)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the trigger bits"""
+        return self.bitmask.nbytes
+
+    def _triggered_at(self, location_index: int) -> np.ndarray:
+        word, position = divmod(location_index, _BITS_PER_WORD)
+        words = self.bitmask if self.bitmask.ndim == 1 else self.bitmask[:, word]
+        return (words & words.dtype.type(1 << position)) != 0
+
+    def triggered(self, location: str) -> np.ndarray:
+        """Boolean array of rows where `location` was triggered"""
+        return self._triggered_at(self.locations.index(location))
+
+    def iter_triggered(self) -> Iterator[np.ndarray]:
+        """`triggered` for every location, one at a time"""
+        for location_index in range(len(self.locations)):
+            yield self._triggered_at(location_index)
+
+    def total_all_locations(self) -> np.ndarray:
+        """Number of locations triggered in each row"""
+        total = np.zeros(len(self), dtype=smallest_unsigned_dtype(len(self.locations)))
+        for triggered in self.iter_triggered():
+            total += triggered
+        return total
+
+    def to_time_series(self, dtype: np.dtype = np.dtype(np.int64)) -> pd.DataFrame:
+        """
+        Dense time series with one indicator column per location, as returned by
+        `lib.data.features.transform_sensor_triggers_to_time_series`.
+        """
+        # the frame is built once from all columns, as inserting one column per location fragments it
+        columns: dict = {name: self.keys[name] for name in self.keys.columns}
+        for location, triggered in zip(self.locations, self.iter_triggered()):
+            columns[location] = triggered.astype(dtype)
+        columns["total_all_locations"] = self.total_all_locations().astype(dtype)
+        return pd.DataFrame(columns)
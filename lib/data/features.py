@@ -1,23 +1,30 @@
 import datetime as dt
-import sqlite3
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Iterable, Iterator, Optional
 
 import numpy as np
 import pandas as pd
 
-RAW_SCHEMA = {
-    "multiple_occupancy": "int64",
-    "home_id": "str",
-    "id": "str",
-    "location": "str",
-    "datetime": "datetime64[ns, UTC]",
-}
+from lib.common.database import get_connection
+from lib.common.instrumentation import instrument
+from lib.data.dtypes import COMPACT_DTYPES, DEFAULT_DTYPES, DtypePolicy
+from lib.data.events import TIME_SERIES_INDEX, SensorTriggers
 
+RAW_SCHEMA = DEFAULT_DTYPES.raw_schema()
+BATHROOM_LOCATIONS = ["bathroom1", "WC1"]
+# modules whose source the features depend on, so cached features are rebuilt when any of them changes
+FEATURE_CODE = ("lib.data.dtypes", "lib.data.events", "lib.data.features")
 
-def read_raw_data(database_location: str, train: bool = False, valid: bool = False, test: bool = False) -> pd.DataFrame:
+
+_RAW_DATA_COLUMNS = "homes.id as home_id, homes.multiple_occupancy, motion.id, motion.datetime, motion.location"
+
+
+def raw_data_sql(train: bool, valid: bool, test: bool, columns: str = _RAW_DATA_COLUMNS) -> str:
     """
-    Load raw data corresponding to the train, valid and/or test sets.
+    Query selecting `columns` of the raw triggers of the requested sets, joining homes, motion and the split table.
     """
-    conn = sqlite3.connect(database_location)
     set_conditions = []
     if train:
         set_conditions.append("is_train")
@@ -29,8 +36,8 @@ def read_raw_data(database_location: str, train: bool = False, valid: bool = Fal
         raise ValueError("At least one of train, valid or test sets should be specified!")
 
     set_condition = "where" + "OR".join(f"({condition})" for condition in set_conditions)
-    sql = f"""
-    select homes.id as home_id, homes.multiple_occupancy, motion.id, motion.datetime, motion.location from homes
+    return f"""
+    select {columns} from homes
     inner join motion
     on homes.id = motion.home_id
     inner join (
@@ -39,76 +46,180 @@ def read_raw_data(database_location: str, train: bool = False, valid: bool = Fal
     ) tvt
     on homes.id = tvt.home_id
     """
-    return pd.read_sql(sql, conn, dtype=RAW_SCHEMA)
 
 
-def transform_sensor_triggers_to_time_series(raw_data: pd.DataFrame) -> pd.DataFrame:
+@instrument()
+def read_raw_data(
+    database_location: str,
+    train: bool = False,
+    valid: bool = False,
+    test: bool = False,
+    dtypes: DtypePolicy = DEFAULT_DTYPES,
+) -> pd.DataFrame:
     """
-    Transform a sequence of sensor triggers into a time series where each column represents a trigger in a location.
+    Load raw data corresponding to the train, valid and/or test sets.
+    """
+    conn = get_connection(database_location)
+    return pd.read_sql(raw_data_sql(train, valid, test), conn, dtype=dtypes.raw_schema())
+
+
+def read_locations(database_location: str) -> list[str]:
+    """
+    All locations with a sensor in any home, so that features built from subsets of homes share columns.
     """
-    locations = list(set(raw_data["location"]))
-    time_series = (
-        raw_data.assign(ones=1)
-        .pivot_table(
-            index=["home_id", "datetime", "multiple_occupancy"], columns=["location"], values="ones", aggfunc="first"
+    conn = get_connection(database_location)
+    return pd.read_sql("select distinct location from motion order by location", conn)["location"].tolist()
+
+
+def _home_slices(chunk: pd.DataFrame) -> Iterator[pd.DataFrame]:
+    """Rows of each home in a chunk ordered by home_id"""
+    home_codes = chunk["home_id"].cat.codes.to_numpy()
+    boundaries = np.flatnonzero(home_codes[1:] != home_codes[:-1]) + 1
+    for start, end in zip(np.concatenate([[0], boundaries]), np.concatenate([boundaries, [len(chunk)]])):
+        yield chunk.iloc[start:end]
+
+
+def iter_raw_data_by_home(
+    database_location: str, train: bool = False, valid: bool = False, test: bool = False, chunksize: int = 1_000_000
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream raw data one home at a time, ordered by home_id and datetime, reading at most `chunksize` rows at once.
+    `home_id` and `location` are categoricals and `datetime` is int64 nanoseconds since the epoch (UTC).
+    """
+    conn = get_connection(database_location)
+    sql = raw_data_sql(train, valid, test)
+    home_id_dtype = pd.CategoricalDtype(pd.read_sql("select id from homes order by id", conn)["id"].astype(str))
+    location_dtype = pd.CategoricalDtype(read_locations(database_location))
+
+    home_frames: list[pd.DataFrame] = []
+    for chunk in pd.read_sql(f"{sql} order by home_id, datetime", conn, chunksize=chunksize):
+        chunk = chunk.astype({"home_id": str, "id": str, "location": str}).astype(
+            {"home_id": home_id_dtype, "location": location_dtype, "multiple_occupancy": "int64"}
         )
-        .fillna(0)
-        .sort_index()
-        .astype(np.int64)
-    )
-    time_series.columns.name = None
-    time_series["total_all_locations"] = time_series[locations].sum(axis=1)
-    return time_series.reset_index()
+        chunk["datetime"] = pd.to_datetime(chunk["datetime"], utc=True).astype("int64")
+        for home_frame in _home_slices(chunk):
+            # a home may continue from the previous chunk
+            if home_frames and home_frames[0]["home_id"].iat[0] != home_frame["home_id"].iat[0]:
+                yield pd.concat(home_frames, axis=0, ignore_index=True)
+                home_frames = []
+            home_frames.append(home_frame)
+    if home_frames:
+        yield pd.concat(home_frames, axis=0, ignore_index=True)
 
 
-def _multiple_columns_1_in_window(x):
-    sum_per_column = np.sum(x, axis=0)
-    columns_with_at_least_1_motion = np.sum(sum_per_column > 0)
-    return columns_with_at_least_1_motion > 1
+@instrument()
+def transform_sensor_triggers_to_time_series(
+    raw_data: pd.DataFrame, locations: Optional[list[str]] = None, dtypes: DtypePolicy = DEFAULT_DTYPES
+) -> pd.DataFrame:
+    """
+    Transform a sequence of sensor triggers into a time series where each column represents a trigger in a location.
+    Locations without any triggers in `raw_data` are added as columns of zeros.
+    """
+    time_series = SensorTriggers.from_raw_data(raw_data, locations).to_time_series(np.dtype(dtypes.indicator))
+    return dtypes.apply_to_keys(time_series)
 
 
-def _add_multiple_room_triggers_in_window_single_home(
-    time_series: pd.DataFrame, window: str, locations: list[str]
+# last trigger time of a location that has not been triggered yet
+NEVER_TRIGGERED = np.iinfo(np.int64).min
+NANOSECONDS_PER_HOUR = pd.Timedelta(hours=1).value
+# append-only assembly writes rates straight into float32 arrays by default, cumulative counts stay integers
+_APPEND_ONLY_DTYPES = DtypePolicy(rate="float32")
+
+
+def window_to_nanoseconds(window: str) -> int:
+    """Length of a pandas offset alias such as "5min" or "2h" in nanoseconds"""
+    return pd.tseries.frequencies.to_offset(window).nanos
+
+
+def _home_starts(home_id: np.ndarray) -> np.ndarray:
+    """Index of the first row of the home of each row, for rows contiguous per home"""
+    rows = np.arange(len(home_id))
+    is_home_start = np.ones(len(home_id), dtype=bool)
+    is_home_start[1:] = home_id[1:] != home_id[:-1]
+    return np.maximum.accumulate(np.where(is_home_start, rows, 0))
+
+
+def _multiple_location_triggers(
+    home_id: np.ndarray, times: np.ndarray, triggered: Iterable[np.ndarray], windows: list[str]
+) -> dict[str, np.ndarray]:
+    """
+    Flag rows where more than one location was triggered in each trailing window (t - window, t].
+    `triggered` yields one boolean array per location.
+
+    Rows must be contiguous per home and in chronological order within each home. Rather than re-summing every
+    window, the last trigger time of each location is carried forward so one pass serves all windows.
+    """
+    n_rows = len(times)
+    rows = np.arange(n_rows)
+    home_start = _home_starts(home_id)
+    window_starts = {window: times - window_to_nanoseconds(window) for window in windows}
+    counts = {window: np.zeros(n_rows, dtype=np.int64) for window in windows}
+    for location_triggered in triggered:
+        last_row = np.maximum.accumulate(np.where(location_triggered, rows, -1))
+        last_time = np.where(last_row >= home_start, times[last_row], NEVER_TRIGGERED)
+        for window, window_start in window_starts.items():
+            counts[window] += last_time > window_start
+    return {window: (count > 1).astype(int) for window, count in counts.items()}
+
+
+@instrument()
+def add_multiple_location_triggers_in_windows(
+    time_series: pd.DataFrame, windows: list[str], locations: list[str]
 ) -> pd.DataFrame:
-    wide_result = (
-        time_series[["datetime"] + locations]
-        .rolling(window, on="datetime", method="table")
-        .apply(_multiple_columns_1_in_window, engine="numba", raw=True)
+    """
+    1 if multiple rooms were triggered during each time window ending at that minute, 0 otherwise
+    """
+    time_series = time_series.sort_values(["home_id", "datetime"], kind="stable", ignore_index=True)
+    triggers = _multiple_location_triggers(
+        time_series["home_id"].to_numpy(),
+        time_series["datetime"].to_numpy(dtype="datetime64[ns]").view(np.int64),
+        (time_series[location].to_numpy() > 0 for location in locations),
+        windows,
     )
-    time_series[f"multiple_room_triggers_{window}"] = wide_result[locations[0]].astype(
-        int
-    )  # can take any location as they all have same values
+    for window, trigger in triggers.items():
+        time_series[f"multiple_room_triggers_{window}"] = trigger
     return time_series
 
 
+def multiple_location_triggers(sensor_triggers: SensorTriggers, windows: list[str]) -> dict[str, np.ndarray]:
+    """
+    1 if multiple rooms were triggered during each time window ending at that minute, 0 otherwise.
+    Reads the trigger bitmask directly rather than a dense time series.
+    """
+    return _multiple_location_triggers(
+        sensor_triggers.keys["home_id"].to_numpy(),
+        sensor_triggers.keys["datetime"].to_numpy(dtype="datetime64[ns]").view(np.int64),
+        sensor_triggers.iter_triggered(),
+        windows,
+    )
+
+
 def add_multiple_location_triggers_in_window(
     time_series: pd.DataFrame, window: str, locations: list[str]
 ) -> pd.DataFrame:
     """
     1 if multiple rooms were triggered during the time window ending at that minute, 0 otherwise
     """
-    results = []
-    for _, df in time_series.groupby("home_id"):
-        results.append(_add_multiple_room_triggers_in_window_single_home(df, window, locations))
-    time_series = pd.concat(results, axis=0, ignore_index=True)
-    return time_series.sort_values(["home_id", "datetime"])
+    return add_multiple_location_triggers_in_windows(time_series, [window], locations)
 
 
+@instrument()
 def add_cumulative_triggers(time_series: pd.DataFrame, columns_to_sum: list[str]) -> pd.DataFrame:
     """
     Record cumulative sensor counts per location
     """
-    cumulative = time_series.groupby("home_id")[columns_to_sum].cumsum()
+    cumulative = time_series.groupby("home_id", observed=True)[columns_to_sum].cumsum()
     cumulative.columns = [col + "_cumulative" for col in cumulative.columns]
     return pd.concat([time_series, cumulative], axis=1)
 
 
+@instrument()
 def add_elapsed_time(time_series: pd.DataFrame) -> pd.DataFrame:
     """
     Add the cumulative time that has passed since the first sensor trigger at each home
     """
     start_time = (
-        time_series.groupby(["home_id"], as_index=False)
+        time_series.groupby(["home_id"], as_index=False, observed=True)
         .agg({"datetime": "min"})
         .rename(columns={"datetime": "start_datetime"})
     )
@@ -119,12 +230,104 @@ def add_elapsed_time(time_series: pd.DataFrame) -> pd.DataFrame:
     return time_series
 
 
-def add_all_features(raw_data: pd.DataFrame, multi_location_windows: list[str]) -> pd.DataFrame:
-    """Convenience function for building all features"""
-    locations = list(set(raw_data["location"]))
-    time_series = transform_sensor_triggers_to_time_series(raw_data)
-    for window in multi_location_windows:
-        time_series = add_multiple_location_triggers_in_window(time_series, window, locations)
+def _cumulative_per_home(values: np.ndarray, home_start: np.ndarray, out: np.ndarray) -> np.ndarray:
+    cumulative = np.cumsum(values, dtype=np.int64)
+    cumulative -= cumulative[home_start] - values[home_start]
+    out[:] = cumulative
+    return out
+
+
+def _derived_columns(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    columns: dict,
+    times: np.ndarray,
+    home_start: np.ndarray,
+    columns_to_sum: list[str],
+    event_columns: list[str],
+    dtypes: DtypePolicy,
+) -> dict[str, np.ndarray]:
+    """Cumulative counts, elapsed time and rates as views of two preallocated column-major arrays"""
+    count_names = [col + "_cumulative" for col in columns_to_sum]
+    rate_names = (
+        ["elapsed_time_hours", "total_all_locations_per_hour"]
+        + [col + "_per_hour" for col in event_columns]
+        + ["bathroom_proportion"]
+    )
+    derived = dict(zip(count_names, np.empty((len(times), len(count_names)), dtype=dtypes.count, order="F").T))
+    derived.update(zip(rate_names, np.empty((len(times), len(rate_names)), dtype=dtypes.rate, order="F").T))
+    for col in columns_to_sum:
+        _cumulative_per_home(columns[col], home_start, derived[col + "_cumulative"])
+    np.divide(times - times[home_start], NANOSECONDS_PER_HOUR, out=derived["elapsed_time_hours"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.divide(
+            derived["total_all_locations_cumulative"],
+            derived["elapsed_time_hours"],
+            out=derived["total_all_locations_per_hour"],
+        )
+        for col in event_columns:
+            np.divide(columns[col], derived["elapsed_time_hours"], out=derived[col + "_per_hour"])
+        bathroom_proportion = derived["bathroom_proportion"]
+        bathroom_proportion[:] = 0
+        for location in BATHROOM_LOCATIONS:
+            bathroom_proportion += derived[location + "_cumulative"]
+        np.divide(bathroom_proportion, derived["total_all_locations_cumulative"], out=bathroom_proportion)
+    return derived
+
+
+def _assemble_all_features(
+    sensor_triggers: SensorTriggers, multi_location_windows: list[str], locations: list[str], dtypes: DtypePolicy
+) -> pd.DataFrame:
+    """
+    `add_all_features` without intermediate frames: the rows stay in the sorted order of `sensor_triggers`, per-home
+    cumulative sums and start times use the home boundaries computed once, and every derived column is written into
+    a preallocated array.
+    """
+    keys = sensor_triggers.keys
+    home_start = _home_starts(keys["home_id"].to_numpy())
+    columns: dict = {name: keys[name] for name in TIME_SERIES_INDEX}
+    for location, triggered in zip(sensor_triggers.locations, sensor_triggers.iter_triggered()):
+        columns[location] = triggered.astype(dtypes.indicator)
+    columns["total_all_locations"] = sensor_triggers.total_all_locations().astype(dtypes.indicator)
+    for window, trigger in multiple_location_triggers(sensor_triggers, multi_location_windows).items():
+        columns[f"multiple_room_triggers_{window}"] = trigger.astype(dtypes.indicator)
+
+    event_columns = [f"multiple_room_triggers_{window}" for window in multi_location_windows]
+    derived = _derived_columns(
+        columns,
+        keys["datetime"].to_numpy(dtype="datetime64[ns]").view(np.int64),
+        home_start,
+        locations + event_columns + ["total_all_locations"],
+        event_columns,
+        dtypes,
+    )
+    # same column order as add_all_features
+    columns.update({name: values for name, values in derived.items() if name.endswith("_cumulative")})
+    columns["start_datetime"] = keys["datetime"].array[home_start]
+    columns.update({name: values for name, values in derived.items() if not name.endswith("_cumulative")})
+    return dtypes.apply_to_keys(pd.DataFrame(columns, copy=False))
+
+
+@instrument()
+def add_all_features(
+    raw_data: pd.DataFrame,
+    multi_location_windows: list[str],
+    locations: Optional[list[str]] = None,
+    append_only: bool = False,
+    dtypes: Optional[DtypePolicy] = None,
+) -> pd.DataFrame:
+    """
+    Convenience function for building all features.
+    With `append_only` the same columns are assembled without copying the frame, with float32 rates unless `dtypes`
+    says otherwise.
+    """
+    if locations is None:
+        locations = list(set(raw_data["location"]))
+    sensor_triggers = SensorTriggers.from_raw_data(raw_data, locations)
+    if append_only:
+        return _assemble_all_features(sensor_triggers, multi_location_windows, locations, dtypes or _APPEND_ONLY_DTYPES)
+    dtypes = dtypes or DEFAULT_DTYPES
+    time_series = sensor_triggers.to_time_series(np.dtype(dtypes.indicator))
+    for window, trigger in multiple_location_triggers(sensor_triggers, multi_location_windows).items():
+        time_series[f"multiple_room_triggers_{window}"] = trigger.astype(dtypes.indicator)
     multiple_location_event_columns = [f"multiple_room_triggers_{window}" for window in multi_location_windows]
     columns_to_sum = locations + multiple_location_event_columns + ["total_all_locations"]
     time_series = add_cumulative_triggers(time_series, columns_to_sum)
@@ -133,6 +336,119 @@ def add_all_features(raw_data: pd.DataFrame, multi_location_windows: list[str])
         new_col = col.replace("_cumulative", "") + "_per_hour"
         time_series[new_col] = time_series[col] / time_series["elapsed_time_hours"]
     time_series["bathroom_proportion"] = (
-        time_series["bathroom1_cumulative"] + time_series["WC1_cumulative"]
-    ) / time_series["total_all_locations_cumulative"]
-    return time_series
+        time_series[[location + "_cumulative" for location in BATHROOM_LOCATIONS]].sum(axis=1)
+        / time_series["total_all_locations_cumulative"]
+    )
+    rate_columns = ["elapsed_time_hours", "total_all_locations_per_hour", "bathroom_proportion"] + [
+        col + "_per_hour" for col in multiple_location_event_columns
+    ]
+    time_series = time_series.astype(
+        {**{col + "_cumulative": dtypes.count for col in columns_to_sum}, **{col: dtypes.rate for col in rate_columns}},
+        copy=False,
+    )
+    return dtypes.apply_to_keys(time_series)
+
+
+def _partition_rows(raw_data: pd.DataFrame, n_partitions: int) -> list[np.ndarray]:
+    home_codes, _ = pd.factorize(raw_data["home_id"], sort=True)
+    # rows without a home id sort first and are dropped, as they are by add_all_features
+    order = np.argsort(home_codes, kind="stable")[np.count_nonzero(home_codes < 0) :]
+    rows_per_home = np.bincount(home_codes[home_codes >= 0])
+    # assign each home to the partition containing the midpoint of its rows
+    midpoints = np.cumsum(rows_per_home) - rows_per_home / 2
+    home_partition = np.minimum((midpoints * n_partitions / max(len(order), 1)).astype(np.int64), n_partitions - 1)
+    partition_ends = np.cumsum(np.bincount(home_partition, weights=rows_per_home, minlength=n_partitions)).astype(int)
+    partition_starts = np.concatenate([[0], partition_ends[:-1]])
+    return [order[start:end] for start, end in zip(partition_starts, partition_ends) if end > start]
+
+
+def partition_homes(raw_data: pd.DataFrame, n_partitions: int) -> list[pd.DataFrame]:
+    """
+    Split raw data into at most `n_partitions` frames of whole homes with similar numbers of rows.
+    Partitions hold contiguous ranges of sorted home ids, so features built per partition concatenate in the same
+    order as `add_all_features` of the whole frame.
+    """
+    return [raw_data.iloc[rows] for rows in _partition_rows(raw_data, n_partitions)]
+
+
+# raw data inherited by forked workers, so partitions are not pickled
+_PARTITIONED_RAW_DATA: Optional[pd.DataFrame] = None
+
+
+def _add_all_features_to_partition(
+    rows: np.ndarray,
+    multi_location_windows: list[str],
+    locations: list[str],
+    append_only: bool,
+    dtypes: Optional[DtypePolicy],
+) -> pd.DataFrame:
+    assert _PARTITIONED_RAW_DATA is not None
+    return add_all_features(_PARTITIONED_RAW_DATA.iloc[rows], multi_location_windows, locations, append_only, dtypes)
+
+
+@instrument()
+def add_all_features_partitioned(  # pylint: disable=too-many-arguments
+    raw_data: pd.DataFrame,
+    multi_location_windows: list[str],
+    locations: Optional[list[str]] = None,
+    *,
+    n_jobs: int = 1,
+    partitions_per_job: int = 4,
+    append_only: bool = False,
+    dtypes: Optional[DtypePolicy] = None,
+) -> pd.DataFrame:
+    """
+    Equivalent to `add_all_features`, building the features of disjoint sets of homes in `n_jobs` forked processes,
+    with -1 for one per CPU.
+    Every partition uses the same `locations`, so columns line up when the partitions are reassembled in order.
+    """
+    global _PARTITIONED_RAW_DATA  # pylint: disable=global-statement
+    from joblib import effective_n_jobs  # pylint: disable=import-outside-toplevel
+
+    if locations is None:
+        locations = list(set(raw_data["location"]))
+    # negative n_jobs count back from the number of CPUs as in joblib
+    n_jobs = effective_n_jobs(n_jobs)
+    partition_rows = _partition_rows(raw_data, n_jobs * partitions_per_job)
+    if n_jobs == 1 or len(partition_rows) <= 1:
+        return add_all_features(raw_data, multi_location_windows, locations, append_only, dtypes)
+    if dtypes is not None and dtypes.categorical:
+        # shared categories, so the partitions concatenate to a categorical
+        raw_data = raw_data.astype({"home_id": "category"})
+    _PARTITIONED_RAW_DATA = raw_data
+    try:
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context("fork")) as executor:
+            features = list(
+                executor.map(
+                    _add_all_features_to_partition,
+                    partition_rows,
+                    repeat(multi_location_windows),
+                    repeat(locations),
+                    repeat(append_only),
+                    repeat(dtypes),
+                )
+            )
+    finally:
+        _PARTITIONED_RAW_DATA = None
+    return pd.concat(features, axis=0, ignore_index=True)
+
+
+def iter_all_features(  # pylint: disable=too-many-arguments
+    database_location: str,
+    multi_location_windows: list[str],
+    *,
+    train: bool = False,
+    valid: bool = False,
+    test: bool = False,
+    chunksize: int = 1_000_000,
+    dtypes: DtypePolicy = COMPACT_DTYPES,
+) -> Iterator[pd.DataFrame]:
+    """
+    Build all features one home at a time so peak memory is bounded by the largest home.
+    The categorical home ids and locations of `iter_raw_data_by_home` are kept and the features follow `dtypes`.
+    """
+    locations = read_locations(database_location)
+    for raw_data in iter_raw_data_by_home(database_location, train, valid, test, chunksize=chunksize):
+        # epoch nanoseconds are reinterpreted as UTC timestamps rather than converted
+        raw_data["datetime"] = pd.Series(raw_data["datetime"].to_numpy().view("datetime64[ns]")).dt.tz_localize("UTC")
+        yield add_all_features(raw_data, multi_location_windows, locations, dtypes=dtypes)
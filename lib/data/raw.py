@@ -1,7 +1,11 @@
+from typing import Optional
+
 import requests
 
+from lib.common.database import close_connections
+from lib.common.download import download_file
 from lib.common.logging import get_logger
-from lib.common.tables import MOTION_TABLE, table_has_data
+from lib.common.tables import MOTION_TABLE, prepare_database, table_has_data
 
 _LOGGER = get_logger(__name__)
 
@@ -9,17 +13,25 @@ _LOGGER = get_logger(__name__)
 _RAW_DATA_URL = "https://imperialcollegelondon.box.com/shared/static/8se12flvva8jcpqwehuyuxob0uj4kfr4.db"
 
 
-def download_raw_data_if_not_exists(database_location) -> None:
+def download_raw_data_if_not_exists(
+    database_location: str, url: str = _RAW_DATA_URL, sha256: Optional[str] = None
+) -> None:
     """
     Download the raw data to a location within the repository for ease of access.
+    The download is streamed to disk, resumed if interrupted and only replaces `database_location` once complete and,
+    if `sha256` is given, verified, raising a ValueError when the checksum does not match.
     """
     if table_has_data(database_location, MOTION_TABLE):
         _LOGGER.info(f"Not downloading again, {database_location} already exists.")
     else:
-        response = requests.get(_RAW_DATA_URL, timeout=2)
-        if response.status_code == 200:
-            with open(database_location, "wb") as f:
-                f.write(response.content)
-            _LOGGER.info(f"Raw data downloaded successfully to {database_location}")
-        else:
-            _LOGGER.info(f"Failed to download {_RAW_DATA_URL}. The response was:\n{repr(response)}")
+        close_connections(database_location)
+        try:
+            digest = download_file(url, database_location, sha256=sha256)
+        except requests.RequestException as error:
+            _LOGGER.info(f"Failed to download {url}: {error!r}")
+            return
+        except ValueError as error:
+            _LOGGER.error(f"Downloaded {url} failed verification: {error}")
+            raise
+        prepare_database(database_location)
+        _LOGGER.info(f"Raw data downloaded successfully to {database_location} with SHA-256 {digest}")
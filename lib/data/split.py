@@ -1,10 +1,11 @@
-import sqlite3
+import hashlib
 
 import numpy as np
 import pandas as pd
 
+from lib.common.database import get_connection
 from lib.common.logging import get_logger
-from lib.common.tables import HOMES_TABLE, MOTION_TABLE, TRAIN_VALID_TEST_TABLE, table_has_data
+from lib.common.tables import HOMES_TABLE, MOTION_TABLE, TRAIN_VALID_TEST_TABLE, prepare_database, table_has_data
 
 _LOGGER = get_logger(__name__)
 
@@ -12,15 +13,55 @@ TRAIN_PROP = 0.5
 VALID_PROP = 0.25
 TEST_PROP = 1.0 - TRAIN_PROP - VALID_PROP
 SPLIT_SEED = 0
+_BATCH_SIZE = 100_000
 
 
-def add_train_valid_test_split_table(database_location: str) -> None:
+def stable_split(home_id: str, seed: int = SPLIT_SEED) -> tuple[bool, bool]:
+    """
+    `(is_train, is_valid)` of a home from a hash of its id, which does not depend on any other home.
+    """
+    digest = hashlib.blake2b(f"{seed}:{home_id}".encode(), digest_size=8).digest()
+    uniform = int.from_bytes(digest, "big") / 2**64
+    return uniform < TRAIN_PROP, TRAIN_PROP <= uniform < TRAIN_PROP + VALID_PROP
+
+
+def _add_new_homes_to_split_table(database_location: str) -> int:
+    conn = get_connection(database_location)
+    conn.execute(
+        f"create table if not exists {TRAIN_VALID_TEST_TABLE} (home_id TEXT, is_train INTEGER, is_valid INTEGER)"
+    )
+    new_home_id_sql = f"""
+    select id from {HOMES_TABLE}
+    where exists (select 1 from {MOTION_TABLE} where {MOTION_TABLE}.home_id = {HOMES_TABLE}.id)
+    and not exists (select 1 from {TRAIN_VALID_TEST_TABLE} where {TRAIN_VALID_TEST_TABLE}.home_id = {HOMES_TABLE}.id)
+    """
+    new_home_ids = [row[0] for row in conn.execute(new_home_id_sql)]
+    insert_sql = f"insert into {TRAIN_VALID_TEST_TABLE} (home_id, is_train, is_valid) values (?, ?, ?)"
+    with conn:
+        for start in range(0, len(new_home_ids), _BATCH_SIZE):
+            conn.executemany(
+                insert_sql, ((home_id, *stable_split(home_id)) for home_id in new_home_ids[start : start + _BATCH_SIZE])
+            )
+    return len(new_home_ids)
+
+
+def add_train_valid_test_split_table(database_location: str, incremental: bool = False) -> None:
     """
     Add train-valid-test indicators to the database
+
+    By default every home is shuffled once and the table is left alone afterwards. With `incremental`, homes missing
+    from the table are assigned by `stable_split` and inserted in one transaction, so existing assignments never move
+    and the proportions are only approximate.
     """
-    conn = sqlite3.connect(database_location)
+    conn = get_connection(database_location)
+    if incremental:
+        n_new_homes = _add_new_homes_to_split_table(database_location)
+        prepare_database(database_location)
+        _LOGGER.info(f"Added {n_new_homes} homes to table {TRAIN_VALID_TEST_TABLE}.")
+        return
     if table_has_data(database_location, TRAIN_VALID_TEST_TABLE):
         _LOGGER.info(f"Table {TRAIN_VALID_TEST_TABLE} already exists, not adding again.")
+        prepare_database(database_location)
         return
     all_home_id_sql = f"""
     select distinct(home_id) from {MOTION_TABLE}
@@ -28,10 +69,9 @@ def add_train_valid_test_split_table(database_location: str) -> None:
     """
     homes = pd.read_sql(all_home_id_sql, conn)
     n_homes = len(homes)
-    np.random.seed(SPLIT_SEED)
     idx = np.arange(n_homes)
-    random_order = idx.copy()
-    np.random.shuffle(random_order)
+    # same order as seeding the global generator, without changing its state
+    random_order = np.random.RandomState(SPLIT_SEED).permutation(n_homes)  # pylint: disable=no-member
 
     homes = homes.iloc[random_order, :]
     train_rows = np.ceil(TRAIN_PROP * n_homes).astype(np.int64)
@@ -39,4 +79,5 @@ def add_train_valid_test_split_table(database_location: str) -> None:
     homes["is_train"] = idx < train_rows
     homes["is_valid"] = (~homes["is_train"]) & (idx < train_rows + valid_rows)
     homes.to_sql(TRAIN_VALID_TEST_TABLE, conn, index=False, if_exists="replace")
+    prepare_database(database_location)
     _LOGGER.info(f"Table {TRAIN_VALID_TEST_TABLE} added successfully.")
@@ -0,0 +1,161 @@
+"""
+SQLite backend for `lib.data.features.add_all_features`.
+
+Sensor triggers are grouped per home and minute, and the multiple room triggers, cumulative counts, elapsed time and
+rates are computed with window functions inside the database, so only one row per home and minute is transferred
+instead of every raw trigger.
+"""
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from lib.common.database import get_connection
+from lib.common.instrumentation import instrument
+from lib.data.features import BATHROOM_LOCATIONS, raw_data_sql, read_locations, window_to_nanoseconds
+
+# epoch milliseconds of an SQLite time value, which may carry a timezone offset
+_EPOCH_MS = "cast(round((julianday(motion.datetime) - 2440587.5) * 86400000) as integer)"
+_RAW_COLUMNS = f"homes.id as home_id, homes.multiple_occupancy, {_EPOCH_MS} as epoch_ms, motion.location"
+_EPOCH_COLUMNS = {"datetime": "epoch_ms", "start_datetime": "start_epoch_ms"}
+_HOME_WINDOW = "window home as (partition by home_id order by epoch_ms rows unbounded preceding)"
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _divide(numerator: str, denominator: str) -> str:
+    # same as pandas: x / 0 is inf for x > 0 and nan (null) for x = 0
+    return (
+        f"case when {denominator} = 0 then (case when ({numerator}) > 0 then 9e999 end) "
+        f"else ({numerator}) * 1.0 / ({denominator}) end"
+    )
+
+
+def _events_sql(multi_location_windows: list[str], sorted_locations: list[str]) -> list[str]:
+    """Columns of the events step: the trigger indicators and a multiple room trigger flag per window"""
+    events = ["home_id", "epoch_ms", "multiple_occupancy"] + [_identifier(location) for location in sorted_locations]
+    events.append("total_all_locations")
+    for window in multi_location_windows:
+        window_ms = window_to_nanoseconds(window) // 1_000_000
+        n_triggered = " + ".join(
+            f"coalesce(last_{i} > epoch_ms - {window_ms}, 0)" for i in range(len(sorted_locations))
+        )
+        events.append(f"({n_triggered or 0}) > 1 as {_identifier(f'multiple_room_triggers_{window}')}")
+    return events
+
+
+def all_features_sql(
+    multi_location_windows: list[str],
+    locations: list[str],
+    train: bool = False,
+    valid: bool = False,
+    test: bool = False,
+) -> str:
+    """
+    Query returning the columns of `add_all_features`, with `datetime` and `start_datetime` as epoch milliseconds.
+    """
+    sorted_locations = sorted(locations)
+    event_columns = [f"multiple_room_triggers_{window}" for window in multi_location_windows]
+    indicators = ",\n".join(
+        f"max(location = {_literal(location)}) as {_identifier(location)}" for location in sorted_locations
+    )
+    total = " + ".join(_identifier(location) for location in sorted_locations) or "0"
+    last_triggers = ",\n".join(
+        f"max(case when {_identifier(location)} then epoch_ms end) over home as last_{i}"
+        for i, location in enumerate(sorted_locations)
+    )
+    events = _events_sql(multi_location_windows, sorted_locations)
+    cumulative = ",\n".join(
+        f"sum({_identifier(column)}) over home as {_identifier(column + '_cumulative')}"
+        for column in locations + event_columns + ["total_all_locations"]
+    )
+    bathrooms = " + ".join(_identifier(location + "_cumulative") for location in BATHROOM_LOCATIONS)
+    rates = (
+        [f"{_divide('total_all_locations_cumulative', 'elapsed_time_hours')} as total_all_locations_per_hour"]
+        + [
+            f"{_divide(_identifier(column), 'elapsed_time_hours')} as {_identifier(column + '_per_hour')}"
+            for column in event_columns
+        ]
+        + [f"{_divide(bathrooms, 'total_all_locations_cumulative')} as bathroom_proportion"]
+    )
+    return f"""
+    with raw as ({raw_data_sql(train, valid, test, _RAW_COLUMNS)}),
+    minutes as (
+        select home_id, epoch_ms, multiple_occupancy,
+        {indicators}
+        from raw
+        group by home_id, epoch_ms, multiple_occupancy
+    ),
+    triggers as (
+        select *, {total} as total_all_locations,
+        {last_triggers}
+        from minutes
+        {_HOME_WINDOW}
+    ),
+    events as (
+        select {", ".join(events)}
+        from triggers
+    ),
+    cumulative as (
+        select *,
+        {cumulative},
+        first_value(epoch_ms) over home as start_epoch_ms
+        from events
+        {_HOME_WINDOW}
+    ),
+    elapsed as (
+        select *, (epoch_ms - start_epoch_ms) / 3600000.0 as elapsed_time_hours from cumulative
+    )
+    select elapsed.*, {", ".join(rates)}
+    from elapsed
+    order by home_id, epoch_ms
+    """
+
+
+@instrument()
+def read_all_features_sql(  # pylint: disable=too-many-arguments
+    database_location: str,
+    multi_location_windows: list[str],
+    *,
+    train: bool = False,
+    valid: bool = False,
+    test: bool = False,
+    locations: Optional[list[str]] = None,
+    columns: Optional[list[str]] = None,
+) -> pd.DataFrame:
+    """
+    Equivalent to `add_all_features(read_raw_data(...), multi_location_windows, locations)[columns]`, computed in
+    SQLite so only `columns` are transferred.
+    Locations default to every location in the database. Times are read at millisecond precision.
+    """
+    if locations is None:
+        locations = read_locations(database_location)
+    sql = all_features_sql(multi_location_windows, locations, train, valid, test)
+    if columns is not None:
+        sql_columns = [_EPOCH_COLUMNS.get(column, column) for column in columns]
+        sql = f"select {', '.join(_identifier(column) for column in sql_columns)} from ({sql})"
+    dtype = {"home_id": "str"} if columns is None or "home_id" in columns else None
+    features = pd.read_sql(sql, get_connection(database_location), dtype=dtype)
+    for column, epoch_column in _EPOCH_COLUMNS.items():
+        if epoch_column in features:
+            features[epoch_column] = pd.to_datetime(features[epoch_column], unit="ms", utc=True)
+    features = features.rename(columns={epoch_column: column for column, epoch_column in _EPOCH_COLUMNS.items()})
+    if columns is None:
+        # same column order as add_all_features
+        columns = list(features.columns)
+        columns.remove("start_datetime")
+        columns.insert(columns.index("elapsed_time_hours"), "start_datetime")
+    integer_columns = (
+        ["multiple_occupancy", "total_all_locations"]
+        + locations
+        + [f"multiple_room_triggers_{window}" for window in multi_location_windows]
+    )
+    integer_columns += [column + "_cumulative" for column in integer_columns[1:]]
+    return features[columns].astype({column: np.int64 for column in integer_columns if column in columns})
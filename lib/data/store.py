@@ -0,0 +1,192 @@
+"""
+On-disk cache of feature frames in the Arrow IPC (Feather) format.
+
+Entries are keyed by the database contents, the requested sets, the multi-location windows and the source of the
+`FEATURE_CODE` modules, so a cached frame is rebuilt whenever any of them changes. Next to the features, a snapshot of
+the latest post warm-up features of every home is kept for scoring the current state of all homes, additionally keyed
+by the warm-up thresholds and the source of `lib.data.warmup`.
+"""
+
+import glob
+import os
+from typing import Optional
+
+import pandas as pd
+from pyarrow import feather
+
+from lib.common.database import get_connection
+from lib.common.hashing import module_sources, stable_hash
+from lib.common.instrumentation import instrument
+from lib.common.logging import get_logger
+from lib.common.paths import FEATURE_STORE_LOCATION
+from lib.common.tables import HOMES_TABLE, MOTION_TABLE, TRAIN_VALID_TEST_TABLE, table_checksum
+from lib.data import features, warmup
+from lib.data.features import add_all_features_partitioned, read_raw_data
+from lib.data.warmup import latest_features, post_warmup_locator
+
+_LOGGER = get_logger(__name__)
+
+
+def database_fingerprint(database_location: str) -> str:
+    """
+    Checksums of the raw tables and the full split table, so any change to their rows gives a new fingerprint.
+    Unlike the file modification time it is unaffected by adding indexes. Computed by SQLite, it costs about a second
+    per million motion rows, well below rebuilding the features.
+    """
+    conn = get_connection(database_location)
+    table_checksums = {
+        table_name: table_checksum(database_location, table_name) for table_name in [HOMES_TABLE, MOTION_TABLE]
+    }
+    split = conn.execute(
+        f"select home_id, is_train, is_valid from {TRAIN_VALID_TEST_TABLE} order by home_id"
+    ).fetchall()
+    return stable_hash({"table_checksums": table_checksums, "split": split})
+
+
+def feature_code_version() -> str:
+    """Hash of the source code of the feature engineering modules"""
+    return stable_hash(module_sources(features.FEATURE_CODE))
+
+
+def _split_name(train: bool, valid: bool, test: bool) -> str:
+    return "_".join(name for name, include in [("train", train), ("valid", valid), ("test", test)] if include)
+
+
+def feature_store_path(  # pylint: disable=too-many-arguments
+    database_location: str,
+    multi_location_windows: list[str],
+    *,
+    train: bool = False,
+    valid: bool = False,
+    test: bool = False,
+    store_location: str = FEATURE_STORE_LOCATION,
+) -> str:
+    """
+    Location of the cached features for the current database contents and feature code.
+    """
+    inputs = {"database": database_fingerprint(database_location), "code": feature_code_version()}
+    return os.path.join(
+        store_location,
+        f"{_split_name(train, valid, test)}-{stable_hash(multi_location_windows)}-{stable_hash(inputs)}.arrow",
+    )
+
+
+def _latest_features_path(features_path: str, minimum_observations: int, minimum_elapsed_time_hours: float) -> str:
+    warmup_version = {
+        "thresholds": [minimum_observations, minimum_elapsed_time_hours],
+        "code": module_sources([warmup.__name__]),
+    }
+    split_name, windows_hash, inputs_hash = os.path.basename(features_path)[: -len(".arrow")].split("-")
+    return os.path.join(
+        os.path.dirname(features_path),
+        f"latest_{split_name}-{windows_hash}-{stable_hash(warmup_version)}-{inputs_hash}.arrow",
+    )
+
+
+def latest_features_store_path(  # pylint: disable=too-many-arguments
+    database_location: str,
+    multi_location_windows: list[str],
+    minimum_observations: int,
+    minimum_elapsed_time_hours: float,
+    *,
+    train: bool = False,
+    valid: bool = False,
+    test: bool = False,
+    store_location: str = FEATURE_STORE_LOCATION,
+) -> str:
+    """
+    Location of the cached latest features snapshot for the current database contents, feature code and warm-up.
+    """
+    features_path = feature_store_path(
+        database_location, multi_location_windows, train=train, valid=valid, test=test, store_location=store_location
+    )
+    return _latest_features_path(features_path, minimum_observations, minimum_elapsed_time_hours)
+
+
+def _write_to_store(df: pd.DataFrame, path: str, stale_glob: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for stale_path in glob.glob(stale_glob):
+        os.remove(stale_path)
+    temp_path = path + ".tmp"
+    feather.write_feather(df, temp_path, compression="uncompressed")
+    os.replace(temp_path, path)
+    _LOGGER.info(f"Cached features to {path}")
+
+
+def _build_features(path: str, raw_data: pd.DataFrame, multi_location_windows: list[str], n_jobs: int) -> pd.DataFrame:
+    df = add_all_features_partitioned(raw_data, multi_location_windows, n_jobs=n_jobs)
+    # entries for the same sets and windows built from older inputs can never be read again
+    _write_to_store(df, path, path.rsplit("-", 1)[0] + "-*.arrow")
+    return df
+
+
+def _read_features(path: str, columns: Optional[list[str]] = None) -> pd.DataFrame:
+    _LOGGER.info(f"Loading cached features from {path}")
+    return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+
+@instrument()
+def load_or_build_features(  # pylint: disable=too-many-arguments
+    database_location: str,
+    multi_location_windows: list[str],
+    *,
+    train: bool = False,
+    valid: bool = False,
+    test: bool = False,
+    columns: Optional[list[str]] = None,
+    store_location: str = FEATURE_STORE_LOCATION,
+    n_jobs: int = 1,
+) -> pd.DataFrame:
+    """
+    Equivalent to `add_all_features(read_raw_data(...), multi_location_windows)[columns]`, reusing features cached by
+    an earlier call when the inputs are unchanged.
+    The cache is memory mapped so only the requested columns are read, and missing features are built by `n_jobs`
+    processes.
+    """
+    path = feature_store_path(
+        database_location, multi_location_windows, train=train, valid=valid, test=test, store_location=store_location
+    )
+    if os.path.exists(path):
+        return _read_features(path, columns)
+    df = _build_features(path, read_raw_data(database_location, train, valid, test), multi_location_windows, n_jobs)
+    if columns is None:
+        return df
+    return df[columns]
+
+
+@instrument()
+def load_or_build_latest_features(  # pylint: disable=too-many-arguments
+    database_location: str,
+    multi_location_windows: list[str],
+    minimum_observations: int,
+    minimum_elapsed_time_hours: float,
+    *,
+    train: bool = False,
+    valid: bool = False,
+    test: bool = False,
+    store_location: str = FEATURE_STORE_LOCATION,
+    n_jobs: int = 1,
+) -> pd.DataFrame:
+    """
+    Equivalent to `latest_features(df, post_warmup_locator(df, minimum_observations, minimum_elapsed_time_hours))` of
+    the features from `load_or_build_features`: one row per home that has passed the warm-up, holding its latest
+    features, `n_eligible_rows` and `first_eligible_datetime`.
+    The snapshot is cached next to the features, so scoring every home does not rebuild or group the time series.
+    """
+    # the database fingerprint behind both paths is computed once
+    features_path = feature_store_path(
+        database_location, multi_location_windows, train=train, valid=valid, test=test, store_location=store_location
+    )
+    path = _latest_features_path(features_path, minimum_observations, minimum_elapsed_time_hours)
+    if os.path.exists(path):
+        _LOGGER.info(f"Loading cached latest features from {path}")
+        return feather.read_feather(path, memory_map=True)
+    if os.path.exists(features_path):
+        df = _read_features(features_path)
+    else:
+        raw_data = read_raw_data(database_location, train, valid, test)
+        df = _build_features(features_path, raw_data, multi_location_windows, n_jobs)
+    snapshot = latest_features(df, post_warmup_locator(df, minimum_observations, minimum_elapsed_time_hours))
+    # only the snapshot of the latest inputs and warm-up is kept for each set and windows
+    _write_to_store(snapshot, path, path.rsplit("-", 2)[0] + "-*.arrow")
+    return snapshot
@@ -0,0 +1,214 @@
+"""
+Incremental feature engineering for live sensor triggers.
+
+Produces the same columns as `lib.data.features.add_all_features`, updating each home's feature vector per event
+instead of recomputing the full history.
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from lib.data.features import BATHROOM_LOCATIONS, NANOSECONDS_PER_HOUR, NEVER_TRIGGERED, window_to_nanoseconds
+
+
+@dataclass
+class _HomeState:
+    """
+    Running state of a single home.
+
+    Counts are stored as `[*locations, *multiple_room_triggers, total_all_locations]`.
+    `committed_counts` covers all minutes before `current_time`, `current_triggers` the minute being built.
+    """
+
+    multiple_occupancy: int
+    start_time: int
+    current_time: int
+    committed_counts: np.ndarray
+    current_triggers: np.ndarray
+    last_triggered: np.ndarray
+
+
+class StreamingFeatureAccumulator:
+    """
+    Stateful per-home feature accumulator for sensor triggers arriving in time order.
+
+    Triggers sharing a home and datetime form a single row, as in `transform_sensor_triggers_to_time_series`,
+    so a later trigger in the same minute revises the row emitted for that minute.
+    """
+
+    def __init__(self, locations: list[str], multi_location_windows: list[str], timezone: Optional[str] = None):
+        self.locations = sorted(locations)
+        self.multi_location_windows = list(multi_location_windows)
+        self.timezone = timezone
+        self._location_index = {location: i for i, location in enumerate(self.locations)}
+        self._window_nanoseconds = np.array(
+            [window_to_nanoseconds(window) for window in self.multi_location_windows], dtype=np.int64
+        )
+        self._bathroom_index = [self._location_index[loc] for loc in BATHROOM_LOCATIONS if loc in self._location_index]
+        self._homes: dict[str, _HomeState] = {}
+
+    @property
+    def multiple_location_event_columns(self) -> list[str]:
+        """Names of the multiple room trigger counts, one per window"""
+        return [f"multiple_room_triggers_{window}" for window in self.multi_location_windows]
+
+    @property
+    def columns(self) -> list[str]:
+        """Columns of emitted feature rows"""
+        count_columns = self.locations + self.multiple_location_event_columns + ["total_all_locations"]
+        return (
+            ["home_id", "datetime", "multiple_occupancy"]
+            + count_columns
+            + [col + "_cumulative" for col in count_columns]
+            + ["start_datetime", "elapsed_time_hours", "total_all_locations_per_hour"]
+            + [col + "_per_hour" for col in self.multiple_location_event_columns]
+            + ["bathroom_proportion"]
+        )
+
+    def _to_nanoseconds(self, datetime: Any) -> int:
+        timestamp = pd.Timestamp(datetime)
+        if self.timezone is None and timestamp.tzinfo is not None:
+            self.timezone = str(timestamp.tzinfo)
+        return timestamp.value
+
+    def _to_timestamp(self, nanoseconds: int) -> pd.Timestamp:
+        return pd.Timestamp(nanoseconds, tz=self.timezone)
+
+    def _new_home(self, multiple_occupancy: int, time: int) -> _HomeState:
+        n_counts = len(self.locations) + len(self.multi_location_windows) + 1
+        return _HomeState(
+            multiple_occupancy=int(multiple_occupancy),
+            start_time=time,
+            current_time=time,
+            committed_counts=np.zeros(n_counts, dtype=np.int64),
+            current_triggers=np.zeros(len(self.locations), dtype=bool),
+            last_triggered=np.full(len(self.locations), NEVER_TRIGGERED, dtype=np.int64),
+        )
+
+    def _current_counts(self, home: _HomeState) -> np.ndarray:
+        locations_in_window = (
+            home.last_triggered[None, :] > home.current_time - self._window_nanoseconds[:, None]
+        ).sum(axis=1)
+        return np.concatenate(
+            [
+                home.current_triggers.astype(np.int64),
+                (locations_in_window > 1).astype(np.int64),
+                [home.current_triggers.sum()],
+            ]
+        )
+
+    def _feature_row(self, home_id: str, home: _HomeState) -> dict[str, Any]:
+        counts = self._current_counts(home)
+        cumulative = home.committed_counts + counts
+        n_locations = len(self.locations)
+        n_windows = len(self.multi_location_windows)
+        elapsed_time_hours = (home.current_time - home.start_time) / NANOSECONDS_PER_HOUR
+        with np.errstate(divide="ignore", invalid="ignore"):
+            per_hour = np.float64(np.concatenate([cumulative[-1:], counts[n_locations:-1]])) / elapsed_time_hours
+            bathroom_proportion = np.float64(cumulative[self._bathroom_index].sum()) / cumulative[-1]
+        count_columns = self.locations + self.multiple_location_event_columns + ["total_all_locations"]
+        row: dict[str, Any] = {
+            "home_id": home_id,
+            "datetime": self._to_timestamp(home.current_time),
+            "multiple_occupancy": home.multiple_occupancy,
+        }
+        row.update(zip(count_columns, counts.tolist()))
+        row.update(zip([col + "_cumulative" for col in count_columns], cumulative.tolist()))
+        row["start_datetime"] = self._to_timestamp(home.start_time)
+        row["elapsed_time_hours"] = elapsed_time_hours
+        row["total_all_locations_per_hour"] = per_hour[0]
+        row.update(
+            zip([col + "_per_hour" for col in self.multiple_location_event_columns], per_hour[1 : n_windows + 1])
+        )
+        row["bathroom_proportion"] = bathroom_proportion
+        return row
+
+    def update(self, home_id: str, datetime: Any, location: str, multiple_occupancy: int) -> dict[str, Any]:
+        """
+        Add a single sensor trigger and return the updated feature row for its home and datetime.
+        """
+        time = self._to_nanoseconds(datetime)
+        home = self._homes.get(home_id)
+        if home is None:
+            home = self._homes[home_id] = self._new_home(multiple_occupancy, time)
+        elif time < home.current_time:
+            raise ValueError(
+                f"Trigger at {self._to_timestamp(time)} for home {home_id} is older than "
+                f"{self._to_timestamp(home.current_time)}, triggers must arrive in time order per home."
+            )
+        elif time > home.current_time:
+            home.committed_counts += self._current_counts(home)
+            home.current_triggers[:] = False
+            home.current_time = time
+        location_index = self._location_index[location]
+        home.current_triggers[location_index] = True
+        home.last_triggered[location_index] = time
+        return self._feature_row(home_id, home)
+
+    def update_batch(self, raw_data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Add a micro-batch of sensor triggers with the columns of `RAW_SCHEMA`.
+        Returns the latest feature row of every home and datetime touched by the batch.
+        """
+        rows = {}
+        batch = raw_data.sort_values("datetime", kind="stable")
+        for home_id, datetime, location, multiple_occupancy in zip(
+            batch["home_id"], batch["datetime"], batch["location"], batch["multiple_occupancy"]
+        ):
+            row = self.update(home_id, datetime, location, multiple_occupancy)
+            rows[(row["home_id"], row["datetime"])] = row
+        features = pd.DataFrame(list(rows.values()), columns=self.columns)
+        return features.sort_values(["home_id", "datetime"], ignore_index=True)
+
+    def get_state(self) -> dict[str, Any]:
+        """
+        JSON serialisable checkpoint of the accumulator.
+        """
+        return {
+            "locations": self.locations,
+            "multi_location_windows": self.multi_location_windows,
+            "timezone": self.timezone,
+            "homes": {
+                home_id: {
+                    "multiple_occupancy": home.multiple_occupancy,
+                    "start_time": home.start_time,
+                    "current_time": home.current_time,
+                    "committed_counts": home.committed_counts.tolist(),
+                    "current_triggers": home.current_triggers.tolist(),
+                    "last_triggered": home.last_triggered.tolist(),
+                }
+                for home_id, home in self._homes.items()
+            },
+        }
+
+    @classmethod
+    def from_state(cls, state: dict[str, Any]) -> "StreamingFeatureAccumulator":
+        """
+        Restore an accumulator from `get_state`.
+        """
+        accumulator = cls(state["locations"], state["multi_location_windows"], state["timezone"])
+        for home_id, home in state["homes"].items():
+            accumulator._homes[home_id] = _HomeState(
+                multiple_occupancy=home["multiple_occupancy"],
+                start_time=home["start_time"],
+                current_time=home["current_time"],
+                committed_counts=np.array(home["committed_counts"], dtype=np.int64),
+                current_triggers=np.array(home["current_triggers"], dtype=bool),
+                last_triggered=np.array(home["last_triggered"], dtype=np.int64),
+            )
+        return accumulator
+
+    def save_checkpoint(self, path: str) -> None:
+        """Write the accumulator state to a JSON file"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.get_state(), f)
+
+    @classmethod
+    def load_checkpoint(cls, path: str) -> "StreamingFeatureAccumulator":
+        """Restore an accumulator written by `save_checkpoint`"""
+        with open(path, encoding="utf-8") as f:
+            return cls.from_state(json.load(f))
@@ -0,0 +1,35 @@
+"""
+Rows of feature frames that have passed the warm-up period, and the latest such row of every home.
+"""
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+def post_warmup_locator(df: pd.DataFrame, minimum_observations: int, minimum_elapsed_time_hours: float):
+    """
+    It may take several observations before a rate (count variable divided by time) is stable enough
+    to be used for predictions.
+    Returns the indices of the dataset that have passed this warmup period.
+    """
+    pass_minimum_observations = df["total_all_locations_cumulative"] > minimum_observations
+    pass_minimum_elapsed_time = df["elapsed_time_hours"] > minimum_elapsed_time_hours
+    return pass_minimum_observations & pass_minimum_elapsed_time
+
+
+def latest_features(df: pd.DataFrame, locator: Optional[pd.Series] = None) -> pd.DataFrame:
+    """
+    Last row of each home among the rows selected by the boolean `locator`, with the number of selected rows in
+    `n_eligible_rows` and the first selected time in `first_eligible_datetime`.
+    Rows must be sorted by home and time, as returned by `add_all_features`.
+    """
+    rows = np.arange(len(df)) if locator is None else np.flatnonzero(np.asarray(locator))
+    home_id = df["home_id"].to_numpy()[rows]
+    first = np.flatnonzero(np.concatenate([[True], home_id[1:] != home_id[:-1]]))[: len(rows)]
+    last = np.append(first[1:], len(rows))[: len(first)] - 1
+    snapshot = df.iloc[rows[last]].reset_index(drop=True)
+    snapshot["n_eligible_rows"] = last - first + 1
+    snapshot["first_eligible_datetime"] = df["datetime"].iloc[rows[first]].reset_index(drop=True)
+    return snapshot
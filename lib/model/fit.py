@@ -1,19 +1,36 @@
+from typing import Optional, Union
+
 import numpy as np
 import pandas as pd
 
 
-def rebalance_classes(df_train: pd.DataFrame, response_col: str) -> pd.DataFrame:
+def rebalance_indices(y: np.ndarray) -> np.ndarray:
     """
-    Resample the class with lowest representation
+    Row positions of the rebalanced training set: every row once, followed by the oversampled rows of the class with
+    lowest representation.
     """
-    single_prop = sum(df_train[response_col] == 0) / len(df_train)
+    single_prop = np.count_nonzero(y == 0) / len(y)
     class_to_oversample = 1 if single_prop > 0.5 else 0
     oversample_rate = 0.5 - min(single_prop, 0.5 - single_prop)
-    oversample_n = int(np.floor(oversample_rate * len(df_train)))
+    oversample_n = int(np.floor(oversample_rate * len(y)))
     np.random.seed(0)
-    new_indices = np.random.choice(df_train.loc[df_train[response_col] == class_to_oversample, :].index, oversample_n)
-    new_df = df_train.loc[new_indices, :]
-    return pd.concat([df_train, new_df], axis=0, ignore_index=True)
+    new_indices = np.random.choice(np.flatnonzero(y == class_to_oversample), oversample_n)
+    return np.concatenate([np.arange(len(y)), new_indices])
+
+
+def rebalance_weights(y: np.ndarray) -> np.ndarray:
+    """
+    Number of times each row appears in the rebalanced training set, as float32 sample weights.
+    Fitting with these weights is equivalent to fitting on `rebalance_classes` without duplicating any rows.
+    """
+    return np.bincount(rebalance_indices(y), minlength=len(y)).astype(np.float32)
+
+
+def rebalance_classes(df_train: pd.DataFrame, response_col: str) -> pd.DataFrame:
+    """
+    Resample the class with lowest representation
+    """
+    return df_train.iloc[rebalance_indices(df_train[response_col].to_numpy())].reset_index(drop=True)
 
 
 def add_fake_features(df_train, n_fake_features) -> tuple[pd.DataFrame, list[str]]:
@@ -28,12 +45,17 @@ def add_fake_features(df_train, n_fake_features) -> tuple[pd.DataFrame, list[str
     return df_train, fake_features
 
 
-def post_warmup_locator(df: pd.DataFrame, minimum_observations: int, minimum_elapsed_time_hours: float):
+def model_matrix(
+    df: pd.DataFrame, columns: list[str], locator: Optional[pd.Series] = None, dtype: np.dtype = np.dtype(np.float32)
+) -> np.ndarray:
     """
-    It may take several observations before a rate (count variable divided by time) is stable enough
-    to be used for predictions.
-    Returns the indices of the dataset that have passed this warmup period.
+    Row-major `dtype` matrix of `columns` for the rows selected by the boolean `locator`, as expected by
+    `StepwiseFeatureSelector` and ONNX inference sessions.
+    Columns are written one at a time into the result, so mixed column dtypes are never interleaved into a float64
+    intermediate and the selected rows are never copied into a new frame.
     """
-    pass_minimum_observations = df["total_all_locations_cumulative"] > minimum_observations
-    pass_minimum_elapsed_time = df["elapsed_time_hours"] > minimum_elapsed_time_hours
-    return pass_minimum_observations & pass_minimum_elapsed_time
+    rows: Union[slice, np.ndarray] = slice(None) if locator is None else np.flatnonzero(np.asarray(locator))
+    X = np.empty((len(df) if isinstance(rows, slice) else len(rows), len(columns)), dtype=dtype)
+    for i, column in enumerate(columns):
+        X[:, i] = df[column].to_numpy()[rows]
+    return X
@@ -0,0 +1,309 @@
+"""
+Command line runner for the full modelling pipeline: download, split, features, stepwise selection, ONNX export and
+test set scoring, as done by hand in the notebooks.
+
+python -m lib.model.pipeline --pipelines lr dt_shallow --n-jobs 2
+
+Every stage writes a content-hashed artifact, so rerunning only repeats the stages whose code, parameters or inputs
+changed, and independent stages such as the train and test features or the candidate pipelines run concurrently.
+"""
+
+import argparse
+import json
+import pickle
+from typing import Any, Callable
+
+import numpy as np
+from onnxruntime import InferenceSession
+from pyarrow import feather
+from skl2onnx import to_onnx, update_registered_converter
+from skl2onnx.algebra.onnx_ops import OnnxGather  # pylint: disable=no-name-in-module
+from skl2onnx.common.data_types import FloatTensorType
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import roc_auc_score
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+
+from lib.common.dag import Stage, StageGraph
+from lib.common.database import get_connection
+from lib.common.logging import get_logger
+from lib.common.paths import ARTIFACT_LOCATION, DATABASE_LOCATION
+from lib.common.tables import HOMES_TABLE, MOTION_TABLE, TRAIN_VALID_TEST_TABLE, table_checksum
+from lib.data.features import FEATURE_CODE, add_all_features, read_raw_data
+from lib.data.raw import download_raw_data_if_not_exists
+from lib.data.split import add_train_valid_test_split_table
+from lib.data.warmup import post_warmup_locator
+from lib.model.fit import model_matrix, rebalance_weights
+from lib.model.stepwise import StepwiseFeatureSelector
+
+_LOGGER = get_logger(__name__)
+
+RESPONSE = "multiple_occupancy"
+MULTI_LOCATION_WINDOWS = ["5min", "30min", "1h", "2h"]
+SPLITS = ["train", "valid", "test"]
+# modules besides this one whose source each kind of stage depends on, see FEATURE_CODE for the feature stages
+MODEL_CODE = ("lib.data.warmup", "lib.model.fit", "lib.model.stepwise")
+PIPELINES: dict[str, Callable[[float], Pipeline]] = {
+    "lr": lambda min_improvement_r: Pipeline(
+        [
+            ("standard_scaler", StandardScaler()),
+            (
+                "feature_selector",
+                StepwiseFeatureSelector(estimator=LogisticRegression(), min_improvement_r=min_improvement_r),
+            ),
+            ("classifier", LogisticRegression()),
+        ]
+    ),
+    "dt_shallow": lambda min_improvement_r: Pipeline(
+        [
+            (
+                "feature_selector",
+                StepwiseFeatureSelector(
+                    estimator=DecisionTreeClassifier(max_depth=2), min_improvement_r=min_improvement_r
+                ),
+            ),
+            ("classifier", DecisionTreeClassifier(max_depth=2, min_samples_leaf=40000)),
+        ]
+    ),
+    "dt_deep": lambda min_improvement_r: Pipeline(
+        [
+            (
+                "feature_selector",
+                StepwiseFeatureSelector(
+                    estimator=DecisionTreeClassifier(max_depth=4), min_improvement_r=min_improvement_r
+                ),
+            ),
+            ("classifier", DecisionTreeClassifier(max_depth=4, min_samples_leaf=40000)),
+        ]
+    ),
+}
+
+
+def candidate_features(multi_location_windows: list[str]) -> list[str]:
+    """Features offered to the stepwise selection"""
+    multi_room_features = [f"multiple_room_triggers_{window}_per_hour" for window in multi_location_windows]
+    return multi_room_features + ["total_all_locations_per_hour", "bathroom_proportion"]
+
+
+def _stepwise_shape_calculator(operator) -> None:
+    n_selected = len(operator.raw_operator.selected_features_)
+    operator.outputs[0].type = FloatTensorType([operator.inputs[0].type.shape[0], n_selected])
+
+
+def _stepwise_converter(scope, operator, container) -> None:
+    selected_features = np.array(operator.raw_operator.selected_features_, dtype=np.int64)
+    gather = OnnxGather(
+        operator.inputs[0],
+        selected_features,
+        axis=1,
+        op_version=container.target_opset,
+        output_names=operator.outputs[:1],
+    )
+    gather.add_to(scope, container)
+
+
+update_registered_converter(
+    StepwiseFeatureSelector, "HomeSensorsStepwiseFeatureSelector", _stepwise_shape_calculator, _stepwise_converter
+)
+
+
+def raw_data_stage(inputs: dict[str, str], output: str, database_location: str) -> None:
+    """Download the raw data if needed and record a checksum of the content of the raw tables"""
+    del inputs
+    download_raw_data_if_not_exists(database_location)
+    table_checksums = {
+        table_name: table_checksum(database_location, table_name) for table_name in [HOMES_TABLE, MOTION_TABLE]
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(table_checksums, f, sort_keys=True)
+
+
+def split_stage(inputs: dict[str, str], output: str, database_location: str, incremental: bool) -> None:
+    """Add the split table and copy it to the artifact"""
+    del inputs
+    add_train_valid_test_split_table(database_location, incremental=incremental)
+    conn = get_connection(database_location)
+    split = conn.execute(f"select home_id, is_train, is_valid from {TRAIN_VALID_TEST_TABLE} order by home_id")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(split.fetchall(), f)
+
+
+def features_stage(
+    inputs: dict[str, str],
+    output: str,
+    database_location: str,
+    multi_location_windows: list[str],
+    split: str,
+) -> None:
+    """All features of one split"""
+    del inputs
+    raw_data = read_raw_data(database_location, train=split == "train", valid=split == "valid", test=split == "test")
+    feather.write_feather(add_all_features(raw_data, multi_location_windows), output, compression="uncompressed")
+
+
+def _warm_rows(path: str, features: list[str], warmup: dict[str, Any]) -> tuple[np.ndarray, np.ndarray]:
+    df = feather.read_feather(
+        path, columns=features + [RESPONSE, "total_all_locations_cumulative", "elapsed_time_hours"]
+    )
+    locator = post_warmup_locator(df, warmup["minimum_observations"], warmup["minimum_elapsed_time_hours"])
+    return model_matrix(df, features, locator), df.loc[locator, RESPONSE].to_numpy(dtype=np.float32)
+
+
+def fit_stage(  # pylint: disable=too-many-arguments
+    inputs: dict[str, str],
+    output: str,
+    *,
+    pipeline_name: str,
+    features: list[str],
+    warmup: dict[str, Any],
+    min_improvement_r: float,
+) -> None:
+    """Select features and fit a candidate pipeline on the rebalanced training set, scored on the validation set"""
+    X, y = _warm_rows(inputs["features_train"], features, warmup)
+    sample_weight = rebalance_weights(y)
+    pipeline = PIPELINES[pipeline_name](min_improvement_r)
+    pipeline.fit(X, y, **{f"{step}__sample_weight": sample_weight for step, _ in pipeline.steps})
+    X_valid, y_valid = _warm_rows(inputs["features_valid"], features, warmup)
+    valid_auc = roc_auc_score(y_valid, pipeline.predict_proba(X_valid)[:, 1])
+    selected_features = [features[i] for i in pipeline["feature_selector"].selected_features_]
+    _LOGGER.info(f"Pipeline {pipeline_name} selected {selected_features} with validation AUC ROC {valid_auc:.3f}")
+    with open(output, "wb") as f:
+        pickle.dump({"pipeline": pipeline, "selected_features": selected_features, "valid_auc": valid_auc}, f)
+
+
+def onnx_stage(inputs: dict[str, str], output: str, pipeline_name: str, features: list[str]) -> None:
+    """Convert a fitted pipeline to ONNX, taking every candidate feature as input"""
+    with open(inputs[f"fit_{pipeline_name}"], "rb") as f:
+        pipeline = pickle.load(f)["pipeline"]
+    onx = to_onnx(pipeline, np.zeros((1, len(features)), dtype=np.float32), target_opset=12, options={"zipmap": False})
+    with open(output, "wb") as f:
+        f.write(onx.SerializeToString())
+
+
+def score_stage(
+    inputs: dict[str, str], output: str, pipeline_name: str, features: list[str], warmup: dict[str, Any]
+) -> None:
+    """Score the ONNX model on the unseen test set"""
+    X, y = _warm_rows(inputs["features_test"], features, warmup)
+    session = InferenceSession(inputs[f"onnx_{pipeline_name}"], providers=["CPUExecutionProvider"])
+    probabilities = session.run(["probabilities"], {session.get_inputs()[0].name: X})[0][:, 1]
+    test_auc = roc_auc_score(y, probabilities)
+    _LOGGER.info(f"Pipeline {pipeline_name} test AUC ROC {test_auc:.3f}")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"test_auc": test_auc, "n_rows": len(y)}, f)
+
+
+def build_stages(  # pylint: disable=too-many-arguments
+    database_location: str = DATABASE_LOCATION,
+    *,
+    pipeline_names: tuple[str, ...] = tuple(PIPELINES),
+    multi_location_windows: tuple[str, ...] = tuple(MULTI_LOCATION_WINDOWS),
+    minimum_observations: int = 5,
+    minimum_elapsed_time_hours: float = 1.0,
+    min_improvement_r: float = 0.01,
+    incremental_split: bool = False,
+) -> list[Stage]:
+    """
+    Stage graph of the pipeline. The raw data and split stages always run as the database may have changed, every
+    other stage is skipped while its inputs are unchanged.
+    """
+    features = candidate_features(list(multi_location_windows))
+    warmup = {"minimum_observations": minimum_observations, "minimum_elapsed_time_hours": minimum_elapsed_time_hours}
+    stages = [
+        Stage(
+            "raw_data", raw_data_stage, params={"database_location": database_location}, suffix=".json", always_run=True
+        ),
+        Stage(
+            "split",
+            split_stage,
+            inputs=("raw_data",),
+            params={"database_location": database_location, "incremental": incremental_split},
+            suffix=".json",
+            always_run=True,
+        ),
+    ]
+    stages += [
+        Stage(
+            f"features_{split}",
+            features_stage,
+            inputs=("split",),
+            params={
+                "database_location": database_location,
+                "multi_location_windows": list(multi_location_windows),
+                "split": split,
+            },
+            suffix=".arrow",
+            code=FEATURE_CODE,
+        )
+        for split in SPLITS
+    ]
+    for pipeline_name in pipeline_names:
+        stages += [
+            Stage(
+                f"fit_{pipeline_name}",
+                fit_stage,
+                inputs=("features_train", "features_valid"),
+                params={
+                    "pipeline_name": pipeline_name,
+                    "features": features,
+                    "warmup": warmup,
+                    "min_improvement_r": min_improvement_r,
+                },
+                code=MODEL_CODE,
+            ),
+            Stage(
+                f"onnx_{pipeline_name}",
+                onnx_stage,
+                inputs=(f"fit_{pipeline_name}",),
+                params={"pipeline_name": pipeline_name, "features": features},
+                suffix=".onnx",
+                code=MODEL_CODE,
+            ),
+            Stage(
+                f"score_{pipeline_name}",
+                score_stage,
+                inputs=(f"onnx_{pipeline_name}", "features_test"),
+                params={"pipeline_name": pipeline_name, "features": features, "warmup": warmup},
+                suffix=".json",
+                code=MODEL_CODE,
+            ),
+        ]
+    return stages
+
+
+def main() -> None:
+    """Run the pipeline up to the requested stages"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default=DATABASE_LOCATION)
+    parser.add_argument("--artifacts", default=ARTIFACT_LOCATION)
+    parser.add_argument("--pipelines", nargs="+", choices=list(PIPELINES), default=list(PIPELINES))
+    parser.add_argument("--windows", nargs="+", default=MULTI_LOCATION_WINDOWS)
+    parser.add_argument("--minimum-observations", type=int, default=5)
+    parser.add_argument("--minimum-elapsed-time-hours", type=float, default=1.0)
+    parser.add_argument("--min-improvement-r", type=float, default=0.01)
+    parser.add_argument("--incremental-split", action="store_true", help="assign new homes by a stable hash")
+    parser.add_argument("--targets", nargs="+", default=None, help="stages to bring up to date, all by default")
+    parser.add_argument("--n-jobs", type=int, default=1, help="stages run concurrently")
+    args = parser.parse_args()
+    if args.n_jobs < 1:
+        parser.error("--n-jobs must be at least 1")
+
+    stages = build_stages(
+        args.database,
+        pipeline_names=tuple(args.pipelines),
+        multi_location_windows=tuple(args.windows),
+        minimum_observations=args.minimum_observations,
+        minimum_elapsed_time_hours=args.minimum_elapsed_time_hours,
+        min_improvement_r=args.min_improvement_r,
+        incremental_split=args.incremental_split,
+    )
+    graph = StageGraph(args.artifacts, stages)
+    paths = graph.run(args.targets, n_jobs=args.n_jobs)
+    print(f"Ran {graph.ran}, skipped {graph.skipped}")
+    for name, path in paths.items():
+        print(f"{name:<24}{path}")
+
+
+if __name__ == "__main__":
+    main()
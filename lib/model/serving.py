@@ -0,0 +1,190 @@
+"""
+Score per-home feature vectors from many concurrent callers with a single loaded ONNX model.
+
+Requests are coalesced into micro-batches that are run as soon as `max_batch_size` is reached or the oldest request
+has waited `max_latency_ms`.
+"""
+
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Sequence, Union
+
+import numpy as np
+from onnxruntime import InferenceSession, SessionOptions
+
+from lib.common.logging import get_logger
+
+_LOGGER = get_logger(__name__)
+
+_PROBABILITY_OUTPUTS = ["probabilities", "output_probability"]
+
+
+def _positive_class_probability(output) -> np.ndarray:
+    # skl2onnx classifiers output a list of {class: probability} dicts unless converted with zipmap disabled
+    if isinstance(output, list):
+        return np.array([row[1] for row in output], dtype=np.float32)
+    return np.asarray(output)[:, 1]
+
+
+class OnnxScoringService:  # pylint: disable=too-many-instance-attributes
+    """
+    Micro-batching scoring service backed by a pool of reused ONNX inference sessions.
+
+    ```
+    async with OnnxScoringService(onx.SerializeToString()) as service:
+        probability = await service.score(features)
+    ```
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        model: Union[str, bytes],
+        *,
+        max_batch_size: int = 256,
+        max_latency_ms: float = 2.0,
+        n_sessions: int = 1,
+        intra_op_num_threads: int = 1,
+        inter_op_num_threads: int = 1,
+        max_recorded_requests: int = 100_000,
+    ):
+        options = SessionOptions()
+        options.intra_op_num_threads = intra_op_num_threads
+        options.inter_op_num_threads = inter_op_num_threads
+        self._sessions = [
+            InferenceSession(model, sess_options=options, providers=["CPUExecutionProvider"]) for _ in range(n_sessions)
+        ]
+        self._input_name = self._sessions[0].get_inputs()[0].name
+        output_names = [output.name for output in self._sessions[0].get_outputs()]
+        self._output_name = next((name for name in _PROBABILITY_OUTPUTS if name in output_names), output_names[-1])
+        self.max_batch_size = max_batch_size
+        self.max_latency_ms = max_latency_ms
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._requests: Optional[asyncio.Queue] = None
+        self._idle_sessions: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self._batches: set[asyncio.Task] = set()
+        # requests taken off the queue that are not yet part of a running batch
+        self._collecting: list = []
+        self._latencies: deque[float] = deque(maxlen=max_recorded_requests)
+        self._batch_sizes: deque[int] = deque(maxlen=max_recorded_requests)
+        self._first_request: Optional[float] = None
+        self._last_response: Optional[float] = None
+
+    async def start(self) -> None:
+        """Start coalescing requests, must be called from the event loop that will call `score`"""
+        self._executor = ThreadPoolExecutor(max_workers=len(self._sessions))
+        self._requests = asyncio.Queue()
+        self._idle_sessions = asyncio.Queue()
+        for session in self._sessions:
+            self._idle_sessions.put_nowait(session)
+        self._batcher = asyncio.create_task(self._coalesce())
+
+    async def stop(self) -> None:
+        """Answer every request received so far, then release the worker threads"""
+        if self._batcher is not None:
+            self._batcher.cancel()
+            await asyncio.gather(self._batcher, return_exceptions=True)
+            self._batcher = None
+        pending, self._collecting = self._collecting, []
+        if self._requests is not None:
+            while not self._requests.empty():
+                pending.append(self._requests.get_nowait())
+            # later calls to `score` raise rather than wait for a batcher that no longer runs
+            self._requests = None
+        for start in range(0, len(pending), self.max_batch_size):
+            assert self._idle_sessions is not None
+            session = await self._idle_sessions.get()
+            self._schedule_batch(session, pending[start : start + self.max_batch_size])
+        await asyncio.gather(*self._batches, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def __aenter__(self) -> "OnnxScoringService":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    async def score(self, features: Sequence[float]) -> float:
+        """
+        Probability of the positive class for a single feature vector.
+        """
+        if self._requests is None:
+            raise RuntimeError("OnnxScoringService.start() must be awaited before scoring")
+        received = time.perf_counter()
+        if self._first_request is None:
+            self._first_request = received
+        future = asyncio.get_running_loop().create_future()
+        self._requests.put_nowait((np.asarray(features, dtype=np.float32), future, received))
+        return await future
+
+    async def _coalesce(self) -> None:
+        assert self._requests is not None and self._idle_sessions is not None
+        while True:
+            batch = self._collecting = [await self._requests.get()]
+            deadline = batch[0][2] + self.max_latency_ms / 1000
+            while len(batch) < self.max_batch_size:
+                if not self._requests.empty():
+                    batch.append(self._requests.get_nowait())
+                    continue
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._requests.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            session = await self._idle_sessions.get()
+            self._collecting = []
+            self._schedule_batch(session, batch)
+
+    def _schedule_batch(self, session: InferenceSession, batch: list) -> None:
+        task = asyncio.create_task(self._run_batch(session, batch))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, session: InferenceSession, batch: list) -> None:
+        assert self._idle_sessions is not None
+        X = np.stack([features for features, _, _ in batch])
+        try:
+            outputs = await asyncio.get_running_loop().run_in_executor(
+                self._executor, session.run, [self._output_name], {self._input_name: X}
+            )
+            probabilities = _positive_class_probability(outputs[0])
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            _LOGGER.error(f"Failed to score a batch of {len(batch)}: {error!r}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        finally:
+            self._idle_sessions.put_nowait(session)
+        responded = time.perf_counter()
+        self._last_response = responded
+        self._batch_sizes.append(len(batch))
+        for (_, future, received), probability in zip(batch, probabilities):
+            self._latencies.append(responded - received)
+            if not future.done():
+                future.set_result(float(probability))
+
+    def stats(self) -> dict[str, float]:
+        """
+        Latency percentiles, throughput and batching of the requests answered so far.
+        """
+        if not self._latencies:
+            return {"n_requests": 0, "n_batches": 0}
+        latencies_ms = np.array(self._latencies) * 1000
+        elapsed = self._last_response - self._first_request  # type: ignore
+        return {
+            "n_requests": len(latencies_ms),
+            "n_batches": len(self._batch_sizes),
+            "mean_batch_size": float(np.mean(self._batch_sizes)),
+            "p50_latency_ms": float(np.percentile(latencies_ms, 50)),
+            "p99_latency_ms": float(np.percentile(latencies_ms, 99)),
+            "throughput_per_second": len(latencies_ms) / elapsed if elapsed > 0 else float("inf"),
+        }
@@ -1,30 +1,217 @@
-from typing import Union
+# annotations are not evaluated, so numba is only imported by type checkers, and the sklearn estimators, metrics and
+# model selection are imported on first use. sklearn.base itself still loads sklearn, scipy and joblib at import
+from __future__ import annotations
+
+import os
+import tempfile
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import repeat
+from typing import TYPE_CHECKING, Any, Iterator, Optional, Union
 
-import numba
 import numpy as np
-from joblib import Parallel, delayed
-from sklearn.base import BaseEstimator, TransformerMixin
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import roc_auc_score
-from sklearn.model_selection import StratifiedKFold
-from sklearn.tree import DecisionTreeClassifier
+from sklearn.base import BaseEstimator, TransformerMixin, clone
 
+from lib.common.instrumentation import stage
 from lib.common.logging import get_logger
 
+if TYPE_CHECKING:
+    import numba
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.tree import DecisionTreeClassifier
+
 _LOGGER = get_logger(__name__)
 
+# (train_rows, val_rows) of one cross-validation fold
+Fold = tuple[np.ndarray, np.ndarray]
+
+# (coef_, intercept_) of the previous round's LogisticRegression for every fold
+WarmStart = Optional[list[tuple[np.ndarray, np.ndarray]]]
+
+BACKENDS = ["joblib", "shared_memory"]
+# highest possible value of the ROC AUC scoring, which bounds the folds that have not been scored yet
+_MAX_SCORE = 1.0
+
+
+@dataclass
+class Folds:
+    """
+    Cross-validation folds as row indices into one copy of the data, so memory does not grow with the number of
+    folds and each candidate only gathers the rows and columns it fits on.
+    Fortran order keeps each feature column of `X` contiguous.
+    """
+
+    X: np.ndarray
+    y: np.ndarray
+    sample_weight: Optional[np.ndarray]
+    train_rows: list[np.ndarray]
+    val_rows: list[np.ndarray]
+
+    def __len__(self) -> int:
+        return len(self.train_rows)
+
+    def __iter__(self) -> Iterator[Fold]:
+        return zip(self.train_rows, self.val_rows)
+
+
+# state of each worker process in the shared memory backend
+_WORKER_ESTIMATOR = None
+_WORKER_SCORING = None
+_WORKER_FOLDS: Optional[Folds] = None
+
+
+def _set_warm_start(estimator: LogisticRegression, coef: np.ndarray, intercept: np.ndarray, n_features: int) -> None:
+    # features added since `coef` was fitted are the last columns and start from a coefficient of zero
+    estimator.coef_ = np.append(coef, np.zeros((1, n_features - coef.shape[1])), axis=1)
+    estimator.intercept_ = intercept
+
+
+def _cross_validated_score(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    estimator,
+    scoring,
+    folds: Folds,
+    feature_set: list[int],
+    warm_start: WarmStart = None,
+    threshold: Optional[float] = None,
+    keep_coefficients: bool = False,
+) -> tuple[float, int, WarmStart]:
+    """
+    Median score over the folds, the number of folds fitted and, with `keep_coefficients`, the coefficients fitted in
+    every fold.
+    With a `threshold`, folds stop being fitted once the median cannot exceed it even if every remaining fold scored
+    `_MAX_SCORE`, and that upper bound is returned instead of the median, without coefficients.
+    """
+    if warm_start is not None:
+        estimator = clone(estimator).set_params(warm_start=True)
+    X = folds.X[:, feature_set]
+    w = folds.sample_weight
+    scores = []
+    coefficients = []
+    for i, (train_rows, val_rows) in enumerate(folds):
+        if warm_start is not None:
+            _set_warm_start(estimator, *warm_start[i], len(feature_set))
+        estimator.fit(X[train_rows], folds.y[train_rows], sample_weight=None if w is None else w[train_rows])
+        if keep_coefficients:
+            coefficients.append((estimator.coef_.copy(), estimator.intercept_.copy()))
+        scores.append(
+            scoring(
+                folds.y[val_rows],
+                estimator.predict_proba(X[val_rows])[:, 1],
+                sample_weight=None if w is None else w[val_rows],
+            )
+        )
+        if threshold is not None and len(scores) < len(folds):
+            upper_bound = np.median(scores + [_MAX_SCORE] * (len(folds) - len(scores)))
+            if upper_bound <= threshold:
+                return upper_bound, len(scores), None
+    return np.median(scores), len(scores), coefficients if keep_coefficients else None
+
+
+def _write_memmapped_folds(folds: Folds, folder: str) -> dict[str, Any]:
+    def save(name: str, array: Optional[np.ndarray]) -> Optional[str]:
+        if array is None:
+            return None
+        path = os.path.join(folder, f"{name}.npy")
+        np.save(path, array)
+        return path
+
+    return {
+        "X": save("X", folds.X),
+        "y": save("y", folds.y),
+        "sample_weight": save("sample_weight", folds.sample_weight),
+        "train_rows": [save(f"train_rows_{i}", rows) for i, rows in enumerate(folds.train_rows)],
+        "val_rows": [save(f"val_rows_{i}", rows) for i, rows in enumerate(folds.val_rows)],
+    }
+
+
+def _load_memmapped_folds(fold_paths: dict[str, Any]) -> Folds:
+    def load(path: Optional[str]) -> Any:
+        return None if path is None else np.load(path, mmap_mode="r")
+
+    return Folds(
+        X=load(fold_paths["X"]),
+        y=load(fold_paths["y"]),
+        sample_weight=load(fold_paths["sample_weight"]),
+        train_rows=[load(path) for path in fold_paths["train_rows"]],
+        val_rows=[load(path) for path in fold_paths["val_rows"]],
+    )
+
+
+def _init_shared_memory_worker(estimator, scoring, fold_paths: dict[str, Any]) -> None:
+    global _WORKER_ESTIMATOR, _WORKER_SCORING, _WORKER_FOLDS  # pylint: disable=global-statement
+    _WORKER_ESTIMATOR = clone(estimator)
+    _WORKER_SCORING = scoring
+    _WORKER_FOLDS = _load_memmapped_folds(fold_paths)
+
+
+def _shared_memory_score(
+    feature_set: list[int], warm_start: WarmStart, threshold: Optional[float], keep_coefficients: bool
+) -> tuple[float, int, WarmStart]:
+    assert _WORKER_FOLDS is not None
+    return _cross_validated_score(
+        _WORKER_ESTIMATOR, _WORKER_SCORING, _WORKER_FOLDS, feature_set, warm_start, threshold, keep_coefficients
+    )
+
+
+def _quantile_bin(X: np.ndarray, n_bins: int, max_quantile_rows: int = 200_000) -> np.ndarray:
+    """
+    Replace every column by the index of its quantile bin, with edges estimated on a fixed subsample of rows.
+    """
+    rows = np.random.default_rng(0).choice(len(X), min(len(X), max_quantile_rows), replace=False)
+    binned = np.empty(X.shape, dtype=np.uint8, order="F")
+    for column in range(X.shape[1]):
+        edges = np.unique(np.quantile(X[rows, column], np.linspace(0, 1, n_bins + 1)[1:-1]))
+        binned[:, column] = np.searchsorted(edges, X[:, column], side="right")
+    return binned
+
 
-class StepwiseFeatureSelector(BaseEstimator, TransformerMixin):
+def _score_test_statistics(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    estimator: LogisticRegression,
+    X: np.ndarray,
+    y: np.ndarray,
+    features: list[int],
+    candidates: list[int],
+    sample_weight: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Rao score test statistic for adding each candidate to a logistic regression on `features`.
+    Only the current model is fitted, so every candidate is ranked at the cost of a matrix product.
+    """
+    sample_weight = np.ones(len(y)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    if features:
+        p = clone(estimator).fit(X[:, features], y, sample_weight=sample_weight).predict_proba(X[:, features])[:, 1]
+    else:
+        p = np.full(len(y), np.average(y, weights=sample_weight))
+    weights = sample_weight * p * (1 - p)
+    design = np.column_stack([np.ones(len(y)), X[:, features]])
+    weighted_design = design * weights[:, None]
+    X_candidates = X[:, candidates].astype(np.float64)
+    score = X_candidates.T @ (sample_weight * (y - p))
+    cross_information = weighted_design.T @ X_candidates
+    information = np.einsum("ij,ij->j", X_candidates * weights[:, None], X_candidates) - np.einsum(
+        "ij,ij->j", cross_information, np.linalg.pinv(design.T @ weighted_design) @ cross_information
+    )
+    return np.nan_to_num(score**2 / information)
+
+
+class StepwiseFeatureSelector(BaseEstimator, TransformerMixin):  # pylint: disable=too-many-instance-attributes
     """
     Stepwise feature selection for Sklearn Pipelines
     """
 
-    def __init__(
+    def __init__(  # pylint: disable=too-many-arguments
         self,
         estimator: Union[DecisionTreeClassifier, LogisticRegression],
         n_jobs: int = 1,
         cv: int = 5,
         min_improvement_r: float = 0.01,
+        *,
+        backend: str = "joblib",
+        warm_start: bool = False,
+        prescreen_top_k: Optional[int] = None,
+        n_bins: Optional[int] = None,
+        racing: bool = False,
     ):
         """
         Forward feature selection.
@@ -41,58 +228,232 @@ class StepwiseFeatureSelector(BaseEstimator, TransformerMixin):
               include it in the model and remove it from remaining features
             * if no improvement in the model from adding any feature, break
         ```
+
+        With `backend="shared_memory"` and `n_jobs > 1` the cross-validation folds are written to memory mapped
+        files once per fit and scored by a pool of worker processes that persists across rounds, so each task only
+        ships its feature set.
+
+        When the estimator is a LogisticRegression, `warm_start` starts each candidate from the coefficients of the
+        previous round's model with the new coefficient at zero, and `prescreen_top_k` ranks candidates by a score
+        test against the current model so only the top k are cross-validated each round.
+
+        When the estimator is a DecisionTreeClassifier, `n_bins` (at most 256) replaces each feature by its uint8
+        quantile bin once per fit, so the trees fitted for every candidate and fold split on few distinct values
+        instead of re-sorting the continuous features. The final classifier is unaffected.
+
+        With `racing`, each candidate's folds are scored in order and the candidate is abandoned as soon as its
+        median could no longer exceed the score needed to be selected, or, when candidates are scored one at a time,
+        the best candidate so far. Abandoned candidates report the upper bound of their median, which can never be
+        the best of the round, so the selected features are the same as scoring every fold. `round_stats_` counts the
+        fits run and skipped.
+
+        `fit` accepts `sample_weight`, which weights both the fitted models and the validation scores, so integer
+        weights from `lib.model.fit.rebalance_weights` select as if the rows had been duplicated.
         """
+        from sklearn.metrics import roc_auc_score  # pylint: disable=import-outside-toplevel
+        from sklearn.model_selection import StratifiedKFold  # pylint: disable=import-outside-toplevel
+
+        if backend not in BACKENDS:
+            raise ValueError(f"backend should be one of {BACKENDS}, got {backend}")
         self.estimator = estimator
         self.scoring = roc_auc_score
         self.n_jobs = n_jobs
         self.selected_features_: list[int] = []
+        self.round_stats_: list[dict[str, Any]] = []
         self.cv = StratifiedKFold(n_splits=cv, shuffle=True, random_state=42)
         self.min_improvement_r = min_improvement_r
+        self.backend = backend
+        self.warm_start = warm_start
+        self.prescreen_top_k = prescreen_top_k
+        self.n_bins = n_bins
+        self.racing = racing
+
+    def split_folds(self, X: np.ndarray, y: np.ndarray, sample_weight: Optional[np.ndarray] = None) -> Folds:
+        """
+        Split the rows into folds once, keeping only their indices.
+        """
+        splits: list[Fold] = list(self.cv.split(X, y))
+        return Folds(
+            X=_quantile_bin(X, self.n_bins) if self.n_bins is not None else np.asfortranarray(X),
+            y=np.asarray(y),
+            sample_weight=sample_weight,
+            train_rows=[train_rows for train_rows, _ in splits],
+            val_rows=[val_rows for _, val_rows in splits],
+        )
+
+    def calculate_score(
+        self,
+        folds: Folds,
+        feature_set: list[int],
+        warm_start: WarmStart = None,
+        threshold: Optional[float] = None,
+    ) -> float:
+        """
+        Fit the model and calculate score on unseen data via K-fold sampling, stopping early below `threshold`.
+        """
+        return _cross_validated_score(self.estimator, self.scoring, folds, feature_set, warm_start, threshold)[0]
 
-    def _calculate_score(self, X: numba.float32[:, :], y: numba.float32[:], feature_set: list[int]) -> numba.float32:
+    def _score_candidates(
+        self,
+        folds: Folds,
+        feature_sets: list[list[int]],
+        executor: Optional[Executor],
+        warm_start: WarmStart,
+        threshold: Optional[float],
+    ) -> tuple[list[float], int, list[WarmStart]]:
+        """
+        Score each feature set, in the worker pool when one is running, and count the folds fitted.
+        With `warm_start` enabled the fold coefficients of every fully fitted candidate are kept, so the next round
+        starts from the winner without refitting it.
+        When racing one candidate at a time, the threshold rises to the best score so far.
+        """
+        from joblib import Parallel, delayed  # pylint: disable=import-outside-toplevel
+
+        keep = self.warm_start
+        if executor is not None:
+            results = list(
+                executor.map(_shared_memory_score, feature_sets, repeat(warm_start), repeat(threshold), repeat(keep))
+            )
+        elif threshold is not None and self.n_jobs == 1:
+            results = []
+            for feature_set in feature_sets:
+                results.append(
+                    _cross_validated_score(
+                        self.estimator, self.scoring, folds, feature_set, warm_start, threshold, keep
+                    )
+                )
+                threshold = max(threshold, results[-1][0])
+        else:
+            results = Parallel(n_jobs=self.n_jobs)(
+                delayed(_cross_validated_score)(self.estimator, self.scoring, folds, fs, warm_start, threshold, keep)
+                for fs in feature_sets
+            )
+        return (
+            [score for score, _, _ in results],
+            sum(n_fits for _, n_fits, _ in results),
+            [coefficients for _, _, coefficients in results],
+        )
+
+    def _candidates(
+        self,
+        X: np.ndarray,
+        y: np.ndarray,
+        sample_weight: Optional[np.ndarray],
+        best_features: list[int],
+        remaining_features: list[int],
+    ) -> list[int]:
         """
-        Fit the model and calculate score on unseen data via K-fold sampling.
+        Remaining features worth cross-validating this round.
         """
-        scores = []
-        for train_index, val_index in self.cv.split(X, y):
-            X_train, X_val = X[train_index], X[val_index]
-            y_train, y_val = y[train_index], y[val_index]
-            self.estimator.fit(X_train[:, feature_set], y_train)
-            y_pred = self.estimator.predict_proba(X_val[:, feature_set])[:, 1]
-            scores.append(self.scoring(y_val, y_pred))
-        return np.median(scores)
+        if self.prescreen_top_k is None or len(remaining_features) <= self.prescreen_top_k:
+            return remaining_features
+        statistics = _score_test_statistics(self.estimator, X, y, best_features, remaining_features, sample_weight)
+        top_k = np.sort(np.argsort(-statistics, kind="stable")[: self.prescreen_top_k])
+        return [remaining_features[i] for i in top_k]
 
-    def _stepwise_selection(self, X: numba.float32[:, :], y: numba.float32[:]) -> list[int]:
+    def _stepwise_selection(
+        self, X: np.ndarray, y: np.ndarray, sample_weight: Optional[np.ndarray] = None
+    ) -> list[int]:
         """
         Perform forward stepwise feature selection algorithm
         """
+        from joblib import effective_n_jobs  # pylint: disable=import-outside-toplevel
+
+        with stage("stepwise_split_folds", rows_in=len(X)):
+            folds = self.split_folds(X, y, sample_weight)
+        # negative n_jobs count back from the number of CPUs as in joblib
+        n_jobs = effective_n_jobs(self.n_jobs)
+        if self.backend == "shared_memory" and n_jobs > 1:
+            with tempfile.TemporaryDirectory() as folder:
+                fold_paths = _write_memmapped_folds(folds, folder)
+                folds = _load_memmapped_folds(fold_paths)
+                with ProcessPoolExecutor(
+                    max_workers=n_jobs,
+                    initializer=_init_shared_memory_worker,
+                    initargs=(self.estimator, self.scoring, fold_paths),
+                ) as executor:
+                    return self._stepwise_rounds(X, y, sample_weight, folds, executor)
+        return self._stepwise_rounds(X, y, sample_weight, folds, None)
+
+    def _stepwise_rounds(  # pylint: disable=too-many-locals
+        self,
+        X: np.ndarray,
+        y: np.ndarray,
+        sample_weight: Optional[np.ndarray],
+        folds: Folds,
+        executor: Optional[Executor],
+    ) -> list[int]:
         best_features: list[int] = []
         best_score = 0.5
+        warm_start: WarmStart = None
 
         remaining_features = list(range(X.shape[1]))
+        self.round_stats_ = []
 
         while remaining_features:
-            scores = Parallel(n_jobs=self.n_jobs)(
-                delayed(self._calculate_score)(X, y, best_features + [feature]) for feature in remaining_features
-            )
+            round_start = time.perf_counter()
+            with stage("stepwise_round", rows_in=len(X), round=len(self.round_stats_)) as record:
+                candidates = self._candidates(X, y, sample_weight, best_features, remaining_features)
+                scores, n_fits, coefficients = self._score_candidates(
+                    folds,
+                    [best_features + [feature] for feature in candidates],
+                    executor,
+                    warm_start,
+                    best_score * (1 + self.min_improvement_r) if self.racing else None,
+                )
+                record.extra["n_scored"] = len(candidates)
+                record.extra["n_fits"] = n_fits
             best_idx = np.argmax(scores)
+            self.round_stats_.append(
+                {
+                    "round": len(self.round_stats_),
+                    "n_candidates": len(remaining_features),
+                    "n_scored": len(candidates),
+                    "n_fits": n_fits,
+                    "n_fits_skipped": len(candidates) * len(folds) - n_fits,
+                    "seconds": time.perf_counter() - round_start,
+                    "best_candidate_score": scores[best_idx],
+                    "selected_feature": None,
+                }
+            )
             if best_score * (1 + self.min_improvement_r) >= scores[best_idx]:
                 _LOGGER.info(
                     f"Finishing as selection best score {scores[best_idx]:.3f}"
                     f"was not better than existing model {best_score:.3f}"
                 )
                 break
-            selected_feature = remaining_features.pop(best_idx)
+            selected_feature = candidates[best_idx]
+            remaining_features.remove(selected_feature)
             best_features.append(selected_feature)
             best_score = max(scores)
-            _LOGGER.info(f"Selected {selected_feature} with best score of {best_score}")
+            if self.warm_start:
+                # a racing candidate abandoned early never beats the selection threshold, so the winner was fitted
+                # on every fold
+                warm_start = coefficients[best_idx]
+            self.round_stats_[-1]["selected_feature"] = selected_feature
+            _LOGGER.info(
+                f"Selected {selected_feature} with best score of {best_score} "
+                f"in {self.round_stats_[-1]['seconds']:.1f}s"
+            )
         return best_features
 
-    def fit(self, X: numba.float32[:, :], y: numba.float32[:]) -> "StepwiseFeatureSelector":
+    def fit(
+        self, X: numba.float32[:, :], y: numba.float32[:], sample_weight: Optional[numba.float32[:]] = None
+    ) -> "StepwiseFeatureSelector":
         """
-        Select features using forward stepwise algorithm.
+        Select features using forward stepwise algorithm, optionally weighting each row by `sample_weight`.
         """
-        self.selected_features_ = self._stepwise_selection(X, y)
+        from sklearn.linear_model import LogisticRegression  # pylint: disable=import-outside-toplevel
+        from sklearn.tree import DecisionTreeClassifier  # pylint: disable=import-outside-toplevel
+
+        if (self.warm_start or self.prescreen_top_k is not None) and not isinstance(self.estimator, LogisticRegression):
+            raise ValueError("warm_start and prescreen_top_k are only supported for LogisticRegression estimators")
+        if self.n_bins is not None and not (
+            isinstance(self.estimator, DecisionTreeClassifier) and 2 <= self.n_bins <= 256
+        ):
+            raise ValueError("n_bins between 2 and 256 is only supported for DecisionTreeClassifier estimators")
+        with stage("StepwiseFeatureSelector.fit", rows_in=len(X)):
+            self.selected_features_ = self._stepwise_selection(X, y, sample_weight)
         _LOGGER.info(f"Selected features: {self.selected_features_}")
         return self
 
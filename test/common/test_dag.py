@@ -0,0 +1,95 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+from lib.common.dag import Stage, StageGraph
+
+
+def write_value(inputs: dict[str, str], output: str, value: str) -> None:
+    """toy stage writing its parameter"""
+    del inputs
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(value)
+
+
+def concatenate(inputs: dict[str, str], output: str, separator: str) -> None:
+    """toy stage joining its inputs"""
+    values = []
+    for name in sorted(inputs):
+        with open(inputs[name], encoding="utf-8") as f:
+            values.append(f.read())
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(separator.join(values))
+
+
+def _read(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def _stages(b_value: str = "b", always_run: bool = False) -> list[Stage]:
+    return [
+        Stage("a", write_value, params={"value": "a"}, suffix=".txt", always_run=always_run),
+        Stage("b", write_value, params={"value": b_value}, suffix=".txt"),
+        Stage("ab", concatenate, inputs=("a", "b"), params={"separator": "+"}, suffix=".txt"),
+    ]
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_stage_graph(n_jobs: int) -> None:
+    """verify stages run after their inputs and are skipped while their code, parameters and inputs are unchanged"""
+    with tempfile.TemporaryDirectory() as artifact_location:
+        graph = StageGraph(artifact_location, _stages())
+        paths = graph.run(n_jobs=n_jobs)
+        assert sorted(graph.ran) == ["a", "ab", "b"] and graph.ran[-1] == "ab"
+        assert _read(paths["ab"]) == "a+b"
+
+        graph.run(n_jobs=n_jobs)
+        assert not graph.ran and sorted(graph.skipped) == ["a", "ab", "b"]
+
+        graph = StageGraph(artifact_location, _stages(b_value="c"))
+        paths = graph.run(n_jobs=n_jobs)
+        assert sorted(graph.ran) == ["ab", "b"]
+        assert _read(paths["ab"]) == "a+c"
+        # artifacts of the replaced stages are removed along with their manifests
+        assert len(os.listdir(artifact_location)) == 6
+
+        graph = StageGraph(artifact_location, _stages(b_value="c", always_run=True))
+        graph.run(["ab"], n_jobs=n_jobs)
+        assert graph.ran == ["a"] and sorted(graph.skipped) == ["ab", "b"]
+        graph.run(["b"], n_jobs=n_jobs)
+        assert not graph.ran and graph.skipped == ["b"]
+
+
+def test_stage_graph_validation() -> None:
+    """verify unknown inputs and cycles are rejected"""
+    with pytest.raises(ValueError):
+        StageGraph("artifacts", [Stage("a", write_value, inputs=("b",))])
+    with pytest.raises(ValueError):
+        StageGraph("artifacts", [Stage("a", write_value, inputs=("b",)), Stage("b", write_value, inputs=("a",))])
+    with tempfile.TemporaryDirectory() as artifact_location, pytest.raises(ValueError):
+        StageGraph(artifact_location, [Stage("a", write_value)]).run(n_jobs=0)
+
+
+def test_stage_code_dependencies() -> None:
+    """verify editing a module listed in a stage's code reruns it"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        module_path = os.path.join(temp_dir, "stage_dependency.py")
+        with open(module_path, "w", encoding="utf-8") as f:
+            f.write("VALUE = 1\n")
+        sys.path.insert(0, temp_dir)
+        try:
+            stages = [Stage("a", write_value, params={"value": "a"}, suffix=".txt", code=("stage_dependency",))]
+            graph = StageGraph(os.path.join(temp_dir, "artifacts"), stages)
+            graph.run()
+            graph.run()
+            assert graph.skipped == ["a"]
+            with open(module_path, "w", encoding="utf-8") as f:
+                f.write("VALUE = 2  # edited\n")
+            graph.run()
+            assert graph.ran == ["a"]
+        finally:
+            sys.path.remove(temp_dir)
+            sys.modules.pop("stage_dependency", None)
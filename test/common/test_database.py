@@ -0,0 +1,26 @@
+import os
+import sqlite3
+import tempfile
+import threading
+
+import pytest
+
+from lib.common.database import close_connections, get_connection
+
+
+def test_close_connections_of_other_threads() -> None:
+    """verify connections opened by other threads are closed rather than leaked"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database_location = os.path.join(temp_dir, "data.db")
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(get_connection(database_location)))
+        thread.start()
+        thread.join()
+        conn = get_connection(database_location)
+        assert connections[0] is not conn
+        close_connections(database_location)
+        for closed in connections + [conn]:
+            with pytest.raises(sqlite3.ProgrammingError, match="closed"):
+                closed.execute("select 1")
+        assert get_connection(database_location).execute("select 1").fetchone() == (1,)
+        close_connections(database_location)
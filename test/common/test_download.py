@@ -0,0 +1,95 @@
+import hashlib
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, Optional
+
+import pytest
+import requests
+
+from lib.common.download import download_file
+from lib.data.raw import download_raw_data_if_not_exists
+
+_PAYLOAD = os.urandom(300_000)
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    """Serves `_PAYLOAD` with range support, dropping the connection after `drop_after` bytes while `drops` > 0"""
+
+    drops = 0
+    drop_after = 100_000
+    ranges: list[Optional[str]] = []
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """Send the requested range of the payload"""
+        requested = self.headers.get("Range")
+        type(self).ranges.append(requested)
+        start = int(requested.split("=")[1].rstrip("-")) if requested else 0
+        if start >= len(_PAYLOAD):
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{len(_PAYLOAD)}")
+            self.end_headers()
+            return
+        self.send_response(206 if requested else 200)
+        if requested:
+            self.send_header("Content-Range", f"bytes {start}-{len(_PAYLOAD) - 1}/{len(_PAYLOAD)}")
+        self.send_header("Content-Length", str(len(_PAYLOAD) - start))
+        self.end_headers()
+        if type(self).drops > 0:
+            type(self).drops -= 1
+            self.wfile.write(_PAYLOAD[start : start + self.drop_after])
+            self.close_connection = True
+            return
+        self.wfile.write(_PAYLOAD[start:])
+
+    def log_message(self, *args) -> None:  # pylint: disable=arguments-differ
+        """Keep test output quiet"""
+
+
+@pytest.fixture(name="url")
+def fixture_url() -> Iterator[str]:
+    """local HTTP server standing in for the raw data host"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RangeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    _RangeHandler.drops, _RangeHandler.ranges = 0, []
+    yield f"http://127.0.0.1:{server.server_address[1]}/data.db"
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_resumes(url: str) -> None:
+    """verify dropped connections are resumed with range requests and the verified file is renamed into place"""
+    _RangeHandler.drops = 2
+    with tempfile.TemporaryDirectory() as temp_dir:
+        destination = os.path.join(temp_dir, "data.db")
+        digest = download_file(
+            url, destination, sha256=hashlib.sha256(_PAYLOAD).hexdigest(), backoff_seconds=0, chunk_size=10_000
+        )
+        with open(destination, "rb") as f:
+            assert f.read() == _PAYLOAD
+        assert os.listdir(temp_dir) == ["data.db"]
+    assert digest == hashlib.sha256(_PAYLOAD).hexdigest()
+    assert _RangeHandler.ranges == [None, "bytes=100000-", "bytes=200000-"]
+
+
+def test_download_checksum_mismatch(url: str) -> None:
+    """verify a corrupted download never reaches the destination"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        destination = os.path.join(temp_dir, "data.db")
+        with pytest.raises(ValueError):
+            download_file(url, destination, sha256="0" * 64, backoff_seconds=0)
+        assert not os.listdir(temp_dir)
+        _RangeHandler.drops = 3
+        with pytest.raises(requests.ConnectionError):
+            download_file(url, destination, max_retries=1, backoff_seconds=0, chunk_size=10_000)
+        assert os.listdir(temp_dir) == ["data.db.part"]
+        assert download_file(url, destination, backoff_seconds=0) == hashlib.sha256(_PAYLOAD).hexdigest()
+
+
+def test_raw_data_checksum_mismatch(url: str) -> None:
+    """verify a raw data download failing its checksum is an error rather than a skipped download"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with pytest.raises(ValueError):
+            download_raw_data_if_not_exists(os.path.join(temp_dir, "data.db"), url, sha256="0" * 64)
@@ -0,0 +1,65 @@
+import json
+import os
+import tempfile
+from test.data.test_features import get_sample_raw_data_with_bathrooms
+
+import numpy as np
+import pytest
+
+from lib.common.instrumentation import (
+    JsonLinesSink,
+    MemorySink,
+    instrument,
+    is_enabled,
+    peak_rss_is_per_stage,
+    recording,
+    stage,
+)
+from lib.data.features import add_all_features
+
+
+@instrument("allocate")
+def _allocate(n_rows: int) -> np.ndarray:
+    return np.ones((n_rows, 1 << 17))  # 1 MB per row
+
+
+def test_stage_records() -> None:
+    """verify nested stages report their own peak memory and enclosing stages include it"""
+    assert not is_enabled()
+    with recording(MemorySink()) as sink:
+        with stage("outer", rows_in=3) as record:
+            _allocate(64)
+            record.rows_out = 2
+    assert not is_enabled()
+    assert len(sink.records) == 2
+    inner, outer = sink.records[0], sink.records[1]
+    assert (inner.stage, inner.parent, inner.rows_out) == ("allocate", "outer", 64)
+    assert (outer.stage, outer.parent, outer.rows_in, outer.rows_out) == ("outer", None, 3, 2)
+    assert inner.wall_seconds <= outer.wall_seconds and outer.cpu_seconds >= 0
+    assert outer.peak_rss_mb >= inner.peak_rss_mb >= 64
+
+
+@pytest.mark.skipif(not peak_rss_is_per_stage(), reason="the peak memory of the process cannot be reset")
+def test_stage_peak_is_reset() -> None:
+    """verify a stage does not report the peak memory of an earlier stage"""
+    with recording(MemorySink()) as sink:
+        _allocate(256)
+        _allocate(16)
+    large, small = sink.records[0], sink.records[1]
+    assert small.peak_rss_mb < large.peak_rss_mb - 128
+
+
+def test_instrumented_features() -> None:
+    """verify feature stages are recorded as JSON lines with their row counts, and nothing is recorded without a sink"""
+    raw_data = get_sample_raw_data_with_bathrooms()
+    add_all_features(raw_data, ["2h"])
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "stages.jsonl")
+        with recording(JsonLinesSink(path)):
+            features = add_all_features(raw_data, ["2h"])
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+    stages = {record["stage"]: record for record in records}
+    assert stages["add_all_features"]["rows_in"] == len(raw_data)
+    assert stages["add_all_features"]["rows_out"] == len(features)
+    assert stages["add_cumulative_triggers"]["parent"] == "add_all_features"
@@ -0,0 +1,48 @@
+import tempfile
+from test.data.test_features import get_sample_raw_data, write_sample_database
+
+from lib.common.database import close_connections, get_connection
+from lib.common.tables import prepare_database, table_checksum, table_has_data
+
+
+def _index_names(database_location: str) -> list[str]:
+    conn = get_connection(database_location)
+    return sorted(row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'"))
+
+
+def test_get_connection_is_shared() -> None:
+    """verify connections are reused until closed"""
+    with tempfile.NamedTemporaryFile(suffix=".db") as temp_db_file:
+        conn = get_connection(temp_db_file.name)
+        assert get_connection(temp_db_file.name) is conn
+        close_connections(temp_db_file.name)
+        assert get_connection(temp_db_file.name) is not conn
+        close_connections(temp_db_file.name)
+
+
+def test_prepare_database() -> None:
+    """verify indexes are added once and tables keep their data"""
+    with tempfile.NamedTemporaryFile(suffix=".db") as temp_db_file:
+        write_sample_database(temp_db_file.name, get_sample_raw_data())
+        prepare_database(temp_db_file.name)
+        index_names = _index_names(temp_db_file.name)
+        prepare_database(temp_db_file.name)
+        assert _index_names(temp_db_file.name) == index_names
+        assert index_names == ["idx_homes_id", "idx_motion_home_id_datetime", "idx_train_valid_test_home_id"]
+        assert table_has_data(temp_db_file.name, "motion")
+        close_connections(temp_db_file.name)
+
+
+def test_table_checksum() -> None:
+    """verify the checksum changes with any row and not with indexes"""
+    with tempfile.NamedTemporaryFile(suffix=".db") as temp_db_file:
+        write_sample_database(temp_db_file.name, get_sample_raw_data())
+        checksum = table_checksum(temp_db_file.name, "motion")
+        assert table_checksum(temp_db_file.name, "motion", chunk_rows=2) == checksum
+        prepare_database(temp_db_file.name)
+        assert table_checksum(temp_db_file.name, "motion") == checksum
+        conn = get_connection(temp_db_file.name)
+        conn.execute("update motion set datetime = '2024-01-02 00:00:00' where id = '0'")
+        conn.commit()
+        assert table_checksum(temp_db_file.name, "motion") != checksum
+        close_connections(temp_db_file.name)
@@ -0,0 +1,53 @@
+import warnings
+from test.data.test_features import _SAMPLE_LOCATIONS, get_sample_raw_data, get_sample_time_series
+
+import numpy as np
+import pandas as pd
+
+from lib.data.events import SensorTriggers
+from lib.data.features import multiple_location_triggers
+
+
+def test_sensor_triggers_bitmask() -> None:
+    """verify triggers are packed into the smallest dtype with one bit per location"""
+    sensor_triggers = SensorTriggers.from_raw_data(get_sample_raw_data(), _SAMPLE_LOCATIONS)
+    assert sensor_triggers.locations == ["bathroom1", "bedroom1", "hallway"]
+    assert sensor_triggers.bitmask.dtype == np.uint8
+    np.testing.assert_array_equal(sensor_triggers.bitmask, [0b010, 0b011, 0b001, 0b100])
+    np.testing.assert_array_equal(sensor_triggers.total_all_locations(), [1, 2, 1, 1])
+    many_locations = _SAMPLE_LOCATIONS + [f"room{i}" for i in range(6)]
+    assert SensorTriggers.from_raw_data(get_sample_raw_data(), many_locations).bitmask.dtype == np.uint16
+
+
+def test_sensor_triggers_multi_word_bitmask() -> None:
+    """verify more than 64 locations are packed into several words with the same triggers as a single word"""
+    raw_data = get_sample_raw_data()
+    raw_data.loc[[1, 4], "location"] = ["room69", "room70"]
+    locations = sorted(set(raw_data["location"]))
+    many_locations = locations + [f"room{i}" for i in range(69)]
+    sensor_triggers = SensorTriggers.from_raw_data(raw_data, many_locations)
+    assert sensor_triggers.bitmask.shape == (len(sensor_triggers), 2) and sensor_triggers.bitmask.dtype == np.uint64
+    expected = SensorTriggers.from_raw_data(raw_data, locations).to_time_series()
+    time_series = sensor_triggers.to_time_series()
+    pd.testing.assert_frame_equal(time_series[expected.columns], expected)
+    assert time_series.drop(columns=expected.columns).to_numpy().sum() == 0
+
+
+def test_sensor_triggers_to_time_series() -> None:
+    """verify the dense time series matches the expected pivot"""
+    sensor_triggers = SensorTriggers.from_raw_data(get_sample_raw_data(), _SAMPLE_LOCATIONS)
+    pd.testing.assert_frame_equal(sensor_triggers.to_time_series(), get_sample_time_series())
+    many_locations = _SAMPLE_LOCATIONS + [f"room{i}" for i in range(127)]
+    with warnings.catch_warnings():
+        # inserting a column per location would fragment the frame
+        warnings.simplefilter("error", pd.errors.PerformanceWarning)
+        time_series = SensorTriggers.from_raw_data(get_sample_raw_data(), many_locations).to_time_series()
+    assert len(time_series.columns) == 3 + len(many_locations) + 1
+
+
+def test_multiple_location_triggers_from_bitmask() -> None:
+    """verify multi-room triggers are computed from the bitmask"""
+    sensor_triggers = SensorTriggers.from_raw_data(get_sample_raw_data(), _SAMPLE_LOCATIONS)
+    triggers = multiple_location_triggers(sensor_triggers, ["30min", "2h"])
+    np.testing.assert_array_equal(triggers["30min"], [0, 1, 0, 0])
+    np.testing.assert_array_equal(triggers["2h"], [0, 1, 1, 0])
@@ -1,11 +1,21 @@
 import datetime as dt
+import sqlite3
+import tempfile
 
 import pandas as pd
 
+from lib.data.dtypes import COMPACT_DTYPES
 from lib.data.features import (
+    add_all_features,
+    add_all_features_partitioned,
     add_cumulative_triggers,
     add_elapsed_time,
     add_multiple_location_triggers_in_window,
+    add_multiple_location_triggers_in_windows,
+    iter_all_features,
+    iter_raw_data_by_home,
+    partition_homes,
+    read_raw_data,
     transform_sensor_triggers_to_time_series,
 )
 
@@ -40,6 +50,25 @@ def get_sample_raw_data() -> pd.DataFrame:
     return pd.concat([df_a, df_b], axis=0, ignore_index=True)
 
 
+def get_sample_raw_data_with_bathrooms() -> pd.DataFrame:
+    """example raw data triggering both bathroom locations"""
+    raw_data = get_sample_raw_data()
+    raw_data["location"] = ["bathroom1", "WC1", "bathroom1", "bedroom1", "hallway"]
+    return raw_data
+
+
+def write_sample_database(database_location: str, raw_data: pd.DataFrame) -> None:
+    """write raw data to the homes, motion and train_valid_test tables, all homes in the training set"""
+    conn = sqlite3.connect(database_location)
+    homes = raw_data.groupby("home_id", as_index=False).agg({"multiple_occupancy": "first"})
+    homes.rename(columns={"home_id": "id"}).to_sql("homes", conn, index=False)
+    motion = raw_data[["home_id", "datetime", "location"]].assign(id=[str(i) for i in range(len(raw_data))])
+    motion.to_sql("motion", conn, index=False)
+    homes[["home_id"]].assign(is_train=True, is_valid=False).to_sql("train_valid_test", conn, index=False)
+    conn.commit()
+    conn.close()
+
+
 def get_sample_time_series() -> pd.DataFrame:
     """time series of sensor triggers"""
     df_a = pd.DataFrame(
@@ -150,6 +179,15 @@ def test_multiple_location_triggers() -> None:
     pd.testing.assert_frame_equal(result, expected_result)
 
 
+def test_multiple_location_triggers_in_windows() -> None:
+    """verify all windows are computed together and match the single window result"""
+    time_series = get_sample_time_series()
+    expected_result = get_sample_time_series_with_2h_multiple_location_trigger()
+    expected_result.insert(len(expected_result.columns) - 1, "multiple_room_triggers_30min", [0, 1, 0, 0])
+    result = add_multiple_location_triggers_in_windows(time_series, ["30min", "2h"], _SAMPLE_LOCATIONS)
+    pd.testing.assert_frame_equal(result, expected_result)
+
+
 def test_cumulative_triggers() -> None:
     """verify cumulative triggers perform as expected"""
     time_series = get_sample_time_series()
@@ -167,6 +205,75 @@ def test_elapsed_time() -> None:
     pd.testing.assert_frame_equal(result, expected_result)
 
 
+def test_iter_raw_data_by_home() -> None:
+    """verify streamed chunks reassemble to the full raw data with one home per frame"""
+    with tempfile.NamedTemporaryFile(suffix=".db") as temp_db_file:
+        write_sample_database(temp_db_file.name, get_sample_raw_data())
+        expected_result = read_raw_data(temp_db_file.name, train=True).sort_values(
+            ["home_id", "datetime"], kind="stable", ignore_index=True
+        )
+        homes = list(iter_raw_data_by_home(temp_db_file.name, train=True, chunksize=2))
+    assert [home["home_id"].nunique() for home in homes] == [1, 1]
+    result = pd.concat(homes, ignore_index=True)
+    assert isinstance(result["location"].dtype, pd.CategoricalDtype)
+    result = result.astype({"home_id": str, "location": str}).assign(
+        datetime=pd.to_datetime(result["datetime"], utc=True)
+    )
+    pd.testing.assert_frame_equal(result, expected_result, check_like=True)
+
+
+def test_iter_all_features() -> None:
+    """verify per-home features keep the compact dtypes and equal the features built from the full raw data"""
+    raw_data = get_sample_raw_data_with_bathrooms()
+    with tempfile.NamedTemporaryFile(suffix=".db") as temp_db_file:
+        write_sample_database(temp_db_file.name, raw_data)
+        expected_result = add_all_features(read_raw_data(temp_db_file.name, train=True), ["2h"])
+        result = pd.concat(
+            list(iter_all_features(temp_db_file.name, ["2h"], train=True, chunksize=3)), ignore_index=True
+        )
+    assert isinstance(result["home_id"].dtype, pd.CategoricalDtype)
+    assert result["bathroom1_cumulative"].dtype == "int32" and result["elapsed_time_hours"].dtype == "float32"
+    pd.testing.assert_frame_equal(result, expected_result, check_like=True, check_dtype=False, check_categorical=False)
+
+
+def test_add_all_features_append_only() -> None:
+    """verify features assembled without intermediate frames equal the features built by concat and merge"""
+    raw_data = get_sample_raw_data_with_bathrooms()
+    expected_result = add_all_features(raw_data, ["5min", "2h"])
+    result = add_all_features(raw_data, ["5min", "2h"], append_only=True)
+    assert (result.dtypes[expected_result.dtypes == "float64"] == "float32").all()
+    assert (result.filter(like="_cumulative").dtypes == "int64").all()
+    pd.testing.assert_frame_equal(result, expected_result, check_dtype=False)
+
+
+def test_add_all_features_compact_dtypes() -> None:
+    """verify the compact dtype policy keeps the feature values of both assembly modes"""
+    raw_data = get_sample_raw_data_with_bathrooms()
+    expected_result = add_all_features(raw_data, ["2h"])
+    compact_raw_data = raw_data.astype({"home_id": "category", "location": "category", "multiple_occupancy": "uint8"})
+    for append_only in [False, True]:
+        result = add_all_features(compact_raw_data, ["2h"], append_only=append_only, dtypes=COMPACT_DTYPES)
+        assert isinstance(result["home_id"].dtype, pd.CategoricalDtype)
+        assert result["bathroom1"].dtype == "uint8" and result["multiple_room_triggers_2h"].dtype == "uint8"
+        assert result["bathroom1_cumulative"].dtype == "int32"
+        assert result["elapsed_time_hours"].dtype == result["bathroom_proportion"].dtype == "float32"
+        pd.testing.assert_frame_equal(result, expected_result, check_dtype=False, check_categorical=False)
+
+
+def test_add_all_features_partitioned() -> None:
+    """verify features built per partition of homes in worker processes equal the serial features"""
+    raw_data = get_sample_raw_data()
+    # reversed so partitioning has to restore the home order
+    raw_data = pd.concat([raw_data, raw_data.assign(home_id=raw_data["home_id"] + "2")], ignore_index=True)[::-1]
+    partitions = partition_homes(raw_data, 2)
+    assert [list(partition["home_id"].unique()) for partition in partitions] == [["a"], ["a2", "b", "b2"]]
+    locations = ["bedroom1", "bathroom1", "WC1", "hallway"]
+    expected_result = add_all_features(raw_data, ["2h"], locations)
+    for n_jobs in [2, -1]:
+        result = add_all_features_partitioned(raw_data, ["2h"], locations, n_jobs=n_jobs)
+        pd.testing.assert_frame_equal(result, expected_result)
+
+
 if __name__ == "__main__":
     time_series = get_sample_time_series()
     expected_result = get_sample_time_series_with_cumulative_triggers()
@@ -0,0 +1,44 @@
+import sqlite3
+import tempfile
+
+import pandas as pd
+
+from lib.data.split import add_train_valid_test_split_table, stable_split
+
+
+def _write_homes(database_location: str, home_ids: list[str]) -> None:
+    conn = sqlite3.connect(database_location)
+    pd.DataFrame({"id": home_ids, "multiple_occupancy": 0}).to_sql("homes", conn, index=False, if_exists="append")
+    pd.DataFrame({"home_id": home_ids, "datetime": "2024-01-01 00:00:00", "location": "hallway"}).to_sql(
+        "motion", conn, index=False, if_exists="append"
+    )
+    conn.commit()
+    conn.close()
+
+
+def _read_split(database_location: str) -> pd.DataFrame:
+    conn = sqlite3.connect(database_location)
+    split = pd.read_sql("select * from train_valid_test order by home_id", conn)
+    conn.close()
+    return split
+
+
+def test_incremental_split() -> None:
+    """verify new homes are added by a stable hash without moving existing homes"""
+    with tempfile.NamedTemporaryFile(suffix=".db") as temp_db_file:
+        _write_homes(temp_db_file.name, [f"home{i}" for i in range(1000)])
+        add_train_valid_test_split_table(temp_db_file.name, incremental=True)
+        first = _read_split(temp_db_file.name)
+        _write_homes(temp_db_file.name, [f"home{i}" for i in range(1000, 1500)])
+        add_train_valid_test_split_table(temp_db_file.name, incremental=True)
+        add_train_valid_test_split_table(temp_db_file.name, incremental=True)
+        second = _read_split(temp_db_file.name)
+
+    assert len(first) == 1000
+    assert len(second) == 1500
+    pd.testing.assert_frame_equal(second.set_index("home_id").loc[first["home_id"]].reset_index(), first)
+    for home_id, is_train, is_valid in second.itertuples(index=False):
+        assert (is_train, is_valid) == stable_split(home_id)
+    assert not (second["is_train"] & second["is_valid"]).any()
+    assert 0.45 < second["is_train"].mean() < 0.55
+    assert 0.2 < second["is_valid"].mean() < 0.3
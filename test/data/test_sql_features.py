@@ -0,0 +1,21 @@
+import tempfile
+from test.data.test_features import get_sample_raw_data_with_bathrooms, write_sample_database
+
+import pandas as pd
+
+from lib.data.features import add_all_features, read_locations, read_raw_data
+from lib.data.sql_features import read_all_features_sql
+
+
+def test_read_all_features_sql() -> None:
+    """verify features computed with SQLite window functions equal the pandas features"""
+    raw_data = get_sample_raw_data_with_bathrooms()
+    columns = ["home_id", "datetime", "multiple_room_triggers_2h_per_hour", "bathroom_proportion", "WC1_cumulative"]
+    with tempfile.NamedTemporaryFile(suffix=".db") as temp_db_file:
+        write_sample_database(temp_db_file.name, raw_data)
+        locations = read_locations(temp_db_file.name)
+        expected_result = add_all_features(read_raw_data(temp_db_file.name, train=True), ["5min", "2h"], locations)
+        result = read_all_features_sql(temp_db_file.name, ["5min", "2h"], train=True)
+        selected = read_all_features_sql(temp_db_file.name, ["5min", "2h"], train=True, columns=columns)
+    pd.testing.assert_frame_equal(result, expected_result)
+    pd.testing.assert_frame_equal(selected, expected_result[columns])
@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import sys
+import tempfile
+from test.data.test_features import get_sample_raw_data, get_sample_raw_data_with_bathrooms, write_sample_database
+
+import pandas as pd
+import pytest
+
+from lib.data import features
+from lib.data.features import add_all_features, read_raw_data
+from lib.data.store import feature_store_path, load_or_build_features, load_or_build_latest_features
+from lib.data.warmup import latest_features, post_warmup_locator
+
+_MULTI_LOCATION_WINDOWS = ["2h"]
+
+
+def test_load_or_build_features() -> None:
+    """verify cached features equal freshly built ones and are rebuilt when the database changes"""
+    raw_data = get_sample_raw_data_with_bathrooms()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database_location = os.path.join(temp_dir, "data.db")
+        store_location = os.path.join(temp_dir, "features")
+        write_sample_database(database_location, raw_data)
+        expected_result = add_all_features(read_raw_data(database_location, train=True), _MULTI_LOCATION_WINDOWS)
+
+        built = load_or_build_features(
+            database_location, _MULTI_LOCATION_WINDOWS, train=True, store_location=store_location
+        )
+        loaded = load_or_build_features(
+            database_location, _MULTI_LOCATION_WINDOWS, train=True, store_location=store_location
+        )
+        pd.testing.assert_frame_equal(built, expected_result)
+        pd.testing.assert_frame_equal(loaded, expected_result)
+        projected = load_or_build_features(
+            database_location,
+            _MULTI_LOCATION_WINDOWS,
+            train=True,
+            columns=["home_id", "bathroom_proportion"],
+            store_location=store_location,
+        )
+        pd.testing.assert_frame_equal(projected, expected_result[["home_id", "bathroom_proportion"]])
+
+        path = feature_store_path(database_location, _MULTI_LOCATION_WINDOWS, train=True, store_location=store_location)
+        conn = sqlite3.connect(database_location)
+        conn.execute("insert into motion values ('b', '2024-01-01 03:00:00', 'WC1', '5')")
+        conn.commit()
+        conn.close()
+        new_path = feature_store_path(
+            database_location, _MULTI_LOCATION_WINDOWS, train=True, store_location=store_location
+        )
+        rebuilt = load_or_build_features(
+            database_location, _MULTI_LOCATION_WINDOWS, train=True, store_location=store_location
+        )
+        assert new_path != path
+        assert len(rebuilt) == len(expected_result) + 1
+        assert os.listdir(store_location) == [os.path.basename(new_path)]
+
+        # updates in place keep the row count and rowids but must still invalidate the cache
+        conn = sqlite3.connect(database_location)
+        conn.execute("update motion set location = 'bedroom1' where id = '5'")
+        conn.commit()
+        conn.close()
+        updated_path = feature_store_path(
+            database_location, _MULTI_LOCATION_WINDOWS, train=True, store_location=store_location
+        )
+        updated = load_or_build_features(
+            database_location, _MULTI_LOCATION_WINDOWS, train=True, store_location=store_location
+        )
+        assert updated_path != new_path
+        assert updated["bedroom1_cumulative"].iloc[-1] == rebuilt["bedroom1_cumulative"].iloc[-1] + 1
+
+
+def test_feature_store_path_code_dependencies(monkeypatch: pytest.MonkeyPatch) -> None:
+    """verify editing any module the features depend on gives a new store path"""
+    assert {"lib.data.dtypes", "lib.data.events", "lib.data.features"} <= set(features.FEATURE_CODE)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database_location = os.path.join(temp_dir, "data.db")
+        write_sample_database(database_location, get_sample_raw_data())
+        module_path = os.path.join(temp_dir, "feature_dependency.py")
+        with open(module_path, "w", encoding="utf-8") as f:
+            f.write("VALUE = 1\n")
+        monkeypatch.syspath_prepend(temp_dir)
+        monkeypatch.setattr(features, "FEATURE_CODE", features.FEATURE_CODE + ("feature_dependency",))
+        try:
+            path = feature_store_path(database_location, _MULTI_LOCATION_WINDOWS, train=True)
+            with open(module_path, "w", encoding="utf-8") as f:
+                f.write("VALUE = 2  # edited\n")
+            assert feature_store_path(database_location, _MULTI_LOCATION_WINDOWS, train=True) != path
+        finally:
+            sys.modules.pop("feature_dependency", None)
+
+
+def test_load_or_build_latest_features() -> None:
+    """verify the cached snapshot equals the latest post warm-up features and sits next to the cached features"""
+    raw_data = get_sample_raw_data_with_bathrooms()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database_location = os.path.join(temp_dir, "data.db")
+        store_location = os.path.join(temp_dir, "features")
+        write_sample_database(database_location, raw_data)
+        df = add_all_features(read_raw_data(database_location, train=True), _MULTI_LOCATION_WINDOWS)
+        expected_result = latest_features(df, post_warmup_locator(df, 1, 0.5))
+
+        built = load_or_build_latest_features(
+            database_location, _MULTI_LOCATION_WINDOWS, 1, 0.5, train=True, store_location=store_location
+        )
+        loaded = load_or_build_latest_features(
+            database_location, _MULTI_LOCATION_WINDOWS, 1, 0.5, train=True, store_location=store_location
+        )
+        assert len(os.listdir(store_location)) == 2
+        # a snapshot with another warm-up replaces the previous one
+        load_or_build_latest_features(
+            database_location, _MULTI_LOCATION_WINDOWS, 2, 0.5, train=True, store_location=store_location
+        )
+        assert len(os.listdir(store_location)) == 2
+    assert expected_result["home_id"].tolist() == ["a"]
+    pd.testing.assert_frame_equal(built, expected_result)
+    pd.testing.assert_frame_equal(loaded, expected_result)
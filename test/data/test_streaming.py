@@ -0,0 +1,66 @@
+import datetime as dt
+import json
+
+import pandas as pd
+
+from lib.data.features import add_all_features
+from lib.data.streaming import StreamingFeatureAccumulator
+
+_MULTI_LOCATION_WINDOWS = ["30min", "2h"]
+
+
+def get_streaming_raw_data() -> pd.DataFrame:
+    """example raw data in UTC including the bathroom locations and repeated minutes"""
+    triggers = [
+        (1, "a", dt.datetime(2024, 1, 1), "bedroom1"),
+        (1, "a", dt.datetime(2024, 1, 1, 0, 10), "WC1"),
+        (1, "a", dt.datetime(2024, 1, 1, 0, 10), "bathroom1"),
+        (1, "a", dt.datetime(2024, 1, 1, 1), "bathroom1"),
+        (1, "a", dt.datetime(2024, 1, 1, 1), "bathroom1"),
+        (1, "a", dt.datetime(2024, 1, 1, 3), "hallway"),
+        (0, "b", dt.datetime(2024, 1, 1, 0, 5), "hallway"),
+        (0, "b", dt.datetime(2024, 1, 1, 2), "WC1"),
+        (0, "b", dt.datetime(2024, 1, 1, 2, 20), "bedroom1"),
+    ]
+    raw_data = pd.DataFrame(triggers, columns=["multiple_occupancy", "home_id", "datetime", "location"])
+    raw_data["datetime"] = pd.to_datetime(raw_data["datetime"], utc=True)
+    return raw_data
+
+
+def _stream_events(accumulator: StreamingFeatureAccumulator, raw_data: pd.DataFrame) -> dict:
+    rows = {}
+    for event in raw_data.to_dict("records"):
+        row = accumulator.update(event["home_id"], event["datetime"], event["location"], event["multiple_occupancy"])
+        rows[(row["home_id"], row["datetime"])] = row
+    return rows
+
+
+def _rows_to_frame(rows: dict, columns: list[str]) -> pd.DataFrame:
+    return pd.DataFrame(list(rows.values()), columns=columns).sort_values(["home_id", "datetime"], ignore_index=True)
+
+
+def test_streaming_matches_batch_features() -> None:
+    """verify event-at-a-time features equal the batch features"""
+    raw_data = get_streaming_raw_data()
+    expected_result = add_all_features(raw_data, _MULTI_LOCATION_WINDOWS)
+    accumulator = StreamingFeatureAccumulator(list(set(raw_data["location"])), _MULTI_LOCATION_WINDOWS)
+    result = _rows_to_frame(_stream_events(accumulator, raw_data), accumulator.columns)
+    pd.testing.assert_frame_equal(result, expected_result, check_like=True)
+
+
+def test_streaming_micro_batches_with_checkpoint() -> None:
+    """verify micro-batches and a checkpoint restore mid-stream equal the batch features"""
+    raw_data = get_streaming_raw_data()
+    expected_result = add_all_features(raw_data, _MULTI_LOCATION_WINDOWS)
+    accumulator = StreamingFeatureAccumulator(list(set(raw_data["location"])), _MULTI_LOCATION_WINDOWS)
+    # the first batch ends part way through a minute of home a
+    first_batch = accumulator.update_batch(raw_data.iloc[[0, 1, 6]])
+    state = json.loads(json.dumps(accumulator.get_state()))
+    restored = StreamingFeatureAccumulator.from_state(state)
+    second_batch = restored.update_batch(raw_data.iloc[[2, 3, 4, 5, 7, 8]])
+    result = (
+        pd.concat([first_batch, second_batch], ignore_index=True)
+        .drop_duplicates(["home_id", "datetime"], keep="last")
+        .sort_values(["home_id", "datetime"], ignore_index=True)
+    )
+    pd.testing.assert_frame_equal(result, expected_result, check_like=True)
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from lib.data.warmup import latest_features, post_warmup_locator
+
+
+def test_latest_features() -> None:
+    """verify the snapshot holds the last selected row, selected row count and first selected time of each home"""
+    df = pd.DataFrame(
+        {
+            "home_id": ["a", "a", "a", "b", "b", "c"],
+            "datetime": pd.date_range("2024-01-01", periods=6, freq="h", tz="UTC"),
+            "rate": [0.0, 1.0, 2.0, 3.0, 4.0, 5.0],
+        }
+    )
+    snapshot = latest_features(df, locator=pd.Series([False, True, True, True, False, False]))
+    expected = df.iloc[[2, 3]].reset_index(drop=True)
+    expected["n_eligible_rows"] = [2, 1]
+    expected["first_eligible_datetime"] = df["datetime"].iloc[[1, 3]].reset_index(drop=True)
+    pd.testing.assert_frame_equal(snapshot, expected)
+    assert len(latest_features(df, locator=pd.Series([False] * 6))) == 0
+    assert latest_features(df)["n_eligible_rows"].tolist() == [3, 2, 1]
+
+
+def test_post_warmup_locator() -> None:
+    """verify rows are selected once both the observation count and the elapsed time exceed their minimums"""
+    df = pd.DataFrame({"total_all_locations_cumulative": [1, 6, 6, 10], "elapsed_time_hours": [2.0, 0.5, 1.5, 3.0]})
+    np.testing.assert_array_equal(post_warmup_locator(df, 5, 1.0), [False, False, True, True])
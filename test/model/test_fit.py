@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from lib.model.fit import model_matrix, rebalance_classes, rebalance_weights
+
+
+def test_model_matrix() -> None:
+    """verify the model matrix selects rows and columns of mixed dtypes as a row-major float32 array"""
+    df = pd.DataFrame(
+        {
+            "count": np.array([1, 2, 3], dtype=np.int32),
+            "indicator": np.array([0, 1, 1], dtype=np.uint8),
+            "rate": np.array([0.5, 1.5, 2.5], dtype=np.float32),
+        }
+    )
+    X = model_matrix(df, ["rate", "count"], locator=df["indicator"] == 1)
+    assert X.dtype == np.float32 and X.flags.c_contiguous
+    np.testing.assert_array_equal(X, [[1.5, 2], [2.5, 3]])
+    np.testing.assert_array_equal(model_matrix(df, ["indicator"]), [[0], [1], [1]])
+
+
+def test_rebalance_weights() -> None:
+    """verify the sample weights count the rows of the rebalanced training set"""
+    df = pd.DataFrame({"response": [0, 0, 0, 0, 0, 0, 1, 1], "feature": np.arange(8)})
+    rebalanced = rebalance_classes(df, "response")
+    assert len(rebalanced) > len(df)
+    weights = rebalance_weights(df["response"].to_numpy())
+    assert weights.dtype == np.float32
+    np.testing.assert_array_equal(weights, np.bincount(rebalanced["feature"], minlength=len(df)))
@@ -0,0 +1,58 @@
+import asyncio
+
+import numpy as np
+import pytest
+from skl2onnx import to_onnx
+from sklearn.datasets import make_classification
+from sklearn.pipeline import Pipeline
+from sklearn.tree import DecisionTreeClassifier
+
+from lib.model.serving import OnnxScoringService
+
+
+async def _score_concurrently(service: OnnxScoringService, X: np.ndarray) -> list[float]:
+    async with service:
+        return await asyncio.gather(*(service.score(features) for features in X))
+
+
+@pytest.mark.parametrize("zipmap", [True, False])
+def test_onnx_scoring_service(zipmap: bool) -> None:
+    """verify micro-batched ONNX scores equal the sklearn probabilities"""
+    X, y = make_classification(n_samples=500, n_features=4, random_state=0)
+    X = X.astype(np.float32)
+    pipeline = Pipeline([("classifier", DecisionTreeClassifier(max_depth=3, random_state=0))]).fit(X, y)
+    onx = to_onnx(pipeline, X[:1], target_opset=12, options={"zipmap": zipmap})
+
+    service = OnnxScoringService(onx.SerializeToString(), max_batch_size=64, max_latency_ms=20.0, n_sessions=2)
+    scores = asyncio.run(_score_concurrently(service, X))
+
+    np.testing.assert_allclose(scores, pipeline.predict_proba(X)[:, 1], rtol=1e-6)
+    stats = service.stats()
+    assert stats["n_requests"] == len(X)
+    assert stats["n_batches"] < len(X)
+    assert stats["p50_latency_ms"] <= stats["p99_latency_ms"]
+
+
+async def _stop_while_scoring(service: OnnxScoringService, X: np.ndarray) -> list[float]:
+    await service.start()
+    requests = [asyncio.ensure_future(service.score(features)) for features in X]
+    # let the batcher take some requests off the queue before stopping
+    await asyncio.sleep(0)
+    await service.stop()
+    scores = await asyncio.wait_for(asyncio.gather(*requests), timeout=10)
+    with pytest.raises(RuntimeError):
+        await service.score(X[0])
+    return scores
+
+
+def test_stop_while_scoring() -> None:
+    """verify stopping the service answers every request already received"""
+    X, y = make_classification(n_samples=300, n_features=4, random_state=0)
+    X = X.astype(np.float32)
+    pipeline = Pipeline([("classifier", DecisionTreeClassifier(max_depth=3, random_state=0))]).fit(X, y)
+    onx = to_onnx(pipeline, X[:1], target_opset=12, options={"zipmap": False})
+
+    service = OnnxScoringService(onx.SerializeToString(), max_batch_size=64, max_latency_ms=1000.0)
+    scores = asyncio.run(_stop_while_scoring(service, X))
+
+    np.testing.assert_allclose(scores, pipeline.predict_proba(X)[:, 1], rtol=1e-6)
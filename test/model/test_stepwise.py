@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import roc_auc_score
+from sklearn.tree import DecisionTreeClassifier
+
+from lib.model.stepwise import StepwiseFeatureSelector, _score_test_statistics
+
+
+class _CountingLogisticRegression(LogisticRegression):  # pylint: disable=too-many-ancestors
+    """LogisticRegression counting the fits of all its clones"""
+
+    n_fits = 0
+
+    def fit(self, X, y, sample_weight=None):
+        type(self).n_fits += 1
+        return super().fit(X, y, sample_weight=sample_weight)
+
+
+def get_sample_classification() -> tuple[np.ndarray, np.ndarray]:
+    """two informative features followed by noise"""
+    X, y = make_classification(
+        n_samples=600,
+        n_features=6,
+        n_informative=2,
+        n_redundant=0,
+        n_repeated=0,
+        shuffle=False,
+        class_sep=0.3,
+        random_state=0,
+    )
+    return X.astype(np.float32), y.astype(np.float32)
+
+
+def test_cached_folds_score() -> None:
+    """verify scores from cached folds equal scores from splitting the full matrix"""
+    X, y = get_sample_classification()
+    selector = StepwiseFeatureSelector(estimator=LogisticRegression())
+    feature_set = [0, 3]
+    scores = []
+    for train_index, val_index in selector.cv.split(X, y):
+        estimator = LogisticRegression().fit(X[train_index][:, feature_set], y[train_index])
+        scores.append(roc_auc_score(y[val_index], estimator.predict_proba(X[val_index][:, feature_set])[:, 1]))
+    folds = selector.split_folds(X, y)
+    assert selector.calculate_score(folds, feature_set) == np.median(scores)
+    # one copy of the features however many folds there are
+    assert folds.X.nbytes == X.nbytes and len(folds) == 5
+    assert all(len(train_rows) + len(val_rows) == len(X) for train_rows, val_rows in folds)
+
+
+def test_stepwise_selection() -> None:
+    """verify the informative features are selected and every round is timed"""
+    X, y = get_sample_classification()
+    selector = StepwiseFeatureSelector(estimator=DecisionTreeClassifier(max_depth=2, random_state=0)).fit(X, y)
+    assert sorted(selector.selected_features_) == [0, 1]
+    assert [stats["selected_feature"] for stats in selector.round_stats_][:-1] == selector.selected_features_
+    assert selector.round_stats_[-1]["selected_feature"] is None
+    assert all(stats["seconds"] >= 0 for stats in selector.round_stats_)
+
+
+def test_shared_memory_backend() -> None:
+    """verify the shared memory worker pool scores candidates exactly as the joblib backend"""
+    X, y = get_sample_classification()
+    estimator = DecisionTreeClassifier(max_depth=2, random_state=0)
+    joblib_selector = StepwiseFeatureSelector(estimator=estimator).fit(X, y)
+    shared_memory_selector = StepwiseFeatureSelector(estimator=estimator, n_jobs=2, backend="shared_memory").fit(X, y)
+    assert shared_memory_selector.selected_features_ == joblib_selector.selected_features_
+    assert [stats["best_candidate_score"] for stats in shared_memory_selector.round_stats_] == [
+        stats["best_candidate_score"] for stats in joblib_selector.round_stats_
+    ]
+    with pytest.raises(ValueError):
+        StepwiseFeatureSelector(estimator=estimator, n_jobs=0, backend="shared_memory").fit(X, y)
+
+
+def test_score_test_statistics() -> None:
+    """verify the score test against the intercept only closed form and that it ranks informative features first"""
+    X, y = get_sample_classification()
+    statistics = _score_test_statistics(LogisticRegression(), X, y, [], list(range(X.shape[1])))
+    correlation = np.array([np.corrcoef(X[:, j], y)[0, 1] for j in range(X.shape[1])])
+    np.testing.assert_allclose(statistics, len(y) * correlation**2, rtol=1e-4)
+    assert np.argmax(statistics) == 1
+    statistics = _score_test_statistics(LogisticRegression(), X, y, [1], [0, 2, 3, 4, 5])
+    assert np.argmax(statistics) == 0
+
+
+def test_sample_weight() -> None:
+    """verify integer sample weights give the score test of duplicated rows and weight every fold"""
+    X, y = get_sample_classification()
+    sample_weight = np.random.default_rng(0).integers(1, 4, len(y)).astype(np.float32)
+    duplicated = np.repeat(np.arange(len(y)), sample_weight.astype(int))
+    for features in [[], [1]]:
+        np.testing.assert_allclose(
+            _score_test_statistics(LogisticRegression(), X, y, features, [0, 2, 3], sample_weight),
+            _score_test_statistics(LogisticRegression(), X[duplicated], y[duplicated], features, [0, 2, 3]),
+            rtol=1e-3,
+        )
+    selector = StepwiseFeatureSelector(estimator=DecisionTreeClassifier(max_depth=2, random_state=0))
+    unweighted_score = selector.calculate_score(selector.split_folds(X, y), [0, 1])
+    assert selector.calculate_score(selector.split_folds(X, y, np.ones_like(y)), [0, 1]) == unweighted_score
+    assert selector.calculate_score(selector.split_folds(X, y, sample_weight), [0, 1]) != unweighted_score
+    assert sorted(selector.fit(X, y, sample_weight=sample_weight).selected_features_) == [0, 1]
+
+
+def test_logistic_regression_fast_path() -> None:
+    """verify warm starts and score test prescreening select the same features as full fits"""
+    X, y = get_sample_classification()
+    selector = StepwiseFeatureSelector(estimator=LogisticRegression()).fit(X, y)
+    fast_selector = StepwiseFeatureSelector(estimator=LogisticRegression(), warm_start=True, prescreen_top_k=2).fit(
+        X, y
+    )
+    assert fast_selector.selected_features_ == selector.selected_features_
+    assert all(stats["n_scored"] <= 2 for stats in fast_selector.round_stats_)
+    _CountingLogisticRegression.n_fits = 0
+    warm_selector = StepwiseFeatureSelector(estimator=_CountingLogisticRegression(), warm_start=True).fit(X, y)
+    assert warm_selector.selected_features_ == selector.selected_features_
+    # the warm start reuses the winning candidate's fits rather than refitting it
+    assert _CountingLogisticRegression.n_fits == sum(stats["n_fits"] for stats in warm_selector.round_stats_)
+
+
+def test_binned_decision_tree() -> None:
+    """verify pre-binned features select the same features as the exact decision tree path"""
+    X, y = get_sample_classification()
+    estimator = DecisionTreeClassifier(max_depth=2, random_state=0)
+    selector = StepwiseFeatureSelector(estimator=estimator).fit(X, y)
+    binned_selector = StepwiseFeatureSelector(estimator=estimator, n_bins=64).fit(X, y)
+    assert binned_selector.selected_features_ == selector.selected_features_
+
+
+def test_racing() -> None:
+    """verify racing skips fits of losing candidates and selects the same features as scoring every fold"""
+    X, y = get_sample_classification()
+    for estimator in [DecisionTreeClassifier(max_depth=2, random_state=0), LogisticRegression()]:
+        selector = StepwiseFeatureSelector(estimator=estimator).fit(X, y)
+        racing_selector = StepwiseFeatureSelector(estimator=estimator, racing=True).fit(X, y)
+        assert racing_selector.selected_features_ == selector.selected_features_
+        assert all(stats["n_fits_skipped"] == 0 for stats in selector.round_stats_)
+        assert sum(stats["n_fits_skipped"] for stats in racing_selector.round_stats_) > 0
+        for stats, racing_stats in zip(selector.round_stats_, racing_selector.round_stats_):
+            assert racing_stats["n_fits"] + racing_stats["n_fits_skipped"] == stats["n_fits"]
+    shared_memory_selector = StepwiseFeatureSelector(
+        estimator=estimator, n_jobs=2, backend="shared_memory", racing=True
+    ).fit(X, y)
+    assert shared_memory_selector.selected_features_ == selector.selected_features_
@@ -0,0 +1,28 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+# heavy dependencies each module must load on first use rather than at import, import time itself is measured by
+# benchmark/bench_imports.py
+_DEFERRED_IMPORTS = [
+    ("lib.data.features", ["numba", "scipy", "sklearn"]),
+    ("lib.model.fit", ["numba", "scipy", "sklearn"]),
+    ("lib.model.stepwise", ["numba", "sklearn.linear_model", "sklearn.metrics", "sklearn.tree"]),
+]
+
+_IMPORT_SCRIPT = """
+import json, sys
+import {module}
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+@pytest.mark.parametrize("module,deferred", _DEFERRED_IMPORTS)
+def test_deferred_imports(module: str, deferred: list[str]) -> None:
+    """verify importing a module in a new interpreter does not load its heavy dependencies"""
+    script = _IMPORT_SCRIPT.format(module=module)
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    modules = json.loads(output.splitlines()[-1])
+    assert [name for name in deferred if name in modules] == []